@@ -2,20 +2,43 @@ import time
 import numpy as np
 import yaml
 import os
-from artnet_manager import ArtnetManager
+from artnet_manager import ArtnetManager, ArtSync, ARTSYNC_BROADCAST
+from backends import KEEPALIVE
 from bar import Bar
+from bar_bank import BarBank
+from audio_features import FeatureExtractor, AudioFrame
 import queue
 import threading
 from colour_manager import ColourManager
 from mode_manager import ModeManager
+from scheduler import FrameScheduler
+from output import DeviceOutput, valid_pixel_order
+from artnet_input import ArtnetInput, MERGE_TIMEOUT
+
+#Written at the top of esp_config.yaml each time it is saved, yaml.dump does not keep comments
+ESP_CONFIG_HEADER = """# One entry per controller (ESP).
+# art_sync: 1 holds each frame until an ArtSync is sent to art_sync_target (default 255.255.255.255), so the controllers
+#   show it together. The ArtSync for a frame is only sent once every device with the same art_sync_target has sent it,
+#   so they all wait on the slowest one. Devices at different fps slow each other down, give them the same fps or
+#   separate art_sync_targets.
+# sacn with multicast (the default) sends each universe to its multicast group, which every receiver on the network can join,
+#   so no two sACN devices may share a universe. A multicast sACN device without a universe starts after the universes of the
+#   sACN device before it, and the universe it is given is saved here. Devices whose universes overlap are warned about at startup.
+# merge: htp or ltp merges Art-Net from a lighting console into the device, on the universes it sends on. The console addresses
+#   universes, not devices, so devices merging input need different universes. A universe is only merged into the first device using it.
+"""
+
 
 class ArtnetController:
-    def __init__(self):
+    def __init__(self, esp_configs = None):
         self.esp_config_file = 'moths_lighting/moths_lighting/config/esp_config.yaml'
+        #esp_configs can be given to run the controller without the config file, eg. for the benchmark
+        self.esp_configs = esp_configs
         self.device_bars_map = {}
         self.artnet_devices = []
-        self.num_leds = 94      #Need to update to 96 for the new strips
+        self.num_leds = 94      #Default LEDs per bar, set num_leds for each device in esp_config for other strips
         self.lock = threading.Lock()
+        self.feature_extractor = FeatureExtractor()
         self.initialize_devices()
         self.fps = self.esp_configs[0].get('fps', 40)
  
@@ -23,21 +46,76 @@ class ArtnetController:
     def initialize_devices(self):
         print("in initialization")
         self.device_bars_map = {}
+        self.device_rows = {}       #The bank rows of each device's bars
+        self.pending_audio = {}     #The averaged audio of each tick since the device's bars last rendered
         self.artnet_devices = []
-        self.esp_configs = self.get_esp_config() 
+        if self.esp_configs is None:
+            self.esp_configs = self.get_esp_config() 
         print("Got esp config")
-        for config in self.esp_configs: 
+        #All bars share one bank so they can be rendered together, bars shorter than the longest are padded
+        formats = [self.get_output_format(config) for config in self.esp_configs]
+        bar_counts = [config.get('num_bars', 1) for config in self.esp_configs]
+        total_bars = sum(bar_counts)
+        bank_leds = max([num_leds for num_leds, _, _ in formats], default=self.num_leds)
+        led_count = np.repeat([num_leds for num_leds, _, _ in formats], bar_counts).astype(int)
+        packet_sizes = [num_bars * num_leds * len(pixel_order) for num_bars, (num_leds, pixel_order, _) in zip(bar_counts, formats)]
+        #The packets of every device are slices of one buffer. When every device takes plain RGB the bank's output is a view of it,
+        #so the bars render straight into the packets and nothing is copied per frame. Otherwise each device's output stage
+        #converts its bars from the bank's output into its packet.
+        self.packet_buffer = bytearray(sum(packet_sizes))
+        passthrough = all(pixel_order == 'RGB' and colour_matrix is None and num_leds == bank_leds for num_leds, pixel_order, colour_matrix in formats)
+        output = np.frombuffer(self.packet_buffer, dtype=np.uint8).reshape(total_bars, bank_leds, 3) if passthrough else None
+        self.bar_bank = BarBank(total_bars, bank_leds, self.feature_extractor, output, led_count)
+        self.device_outputs = {}
+        #Art-Net from a lighting console is merged into the packets of the devices with merge set to htp or ltp
+        self.artnet_input = ArtnetInput()
+        packet_view = memoryview(self.packet_buffer)
+        #Devices with art_sync set latch each frame together when the ArtSync is sent after all of their data.
+        #Devices with the same art_sync_target share one ArtSync, which waits for the slowest of them.
+        self.art_syncs = {}     #art_sync_target -> ArtSync
+        self.frame_generation = 0
+        sacn_universes = {}     #Multicast sACN universe -> target_ip of the device sending it
+        next_sacn_universe = 0
+        bank_idx = 0
+        packet_offset = 0
+        for config, (num_leds, pixel_order, colour_matrix), packet_size in zip(self.esp_configs, formats, packet_sizes): 
             print("Initalising Bars...")
             target_ip = config['target_ip']
-            #universe = config['universe']
+            universe = config.get('universe', 0)
+            keepalive = config.get('keepalive', KEEPALIVE)
+            #Output protocol of the device, artnet, ddp or sacn (sent to each universe's multicast group unless multicast is 0)
+            protocol = config.get('protocol', 'artnet')
+            backend_options = {'multicast': bool(config.get('multicast', 1))} if protocol == 'sacn' else {}
+            multicast_sacn = protocol == 'sacn' and backend_options['multicast']
+            if multicast_sacn and 'universe' not in config:
+                #Every multicast group reaches every receiver, so each device takes the next free universes
+                universe = config['universe'] = next_sacn_universe
+            art_sync = None
+            if config.get('art_sync', 0) and protocol == 'artnet':
+                art_sync_target = config.get('art_sync_target', ARTSYNC_BROADCAST)
+                art_sync = self.art_syncs.setdefault(art_sync_target, ArtSync(art_sync_target))
             num_bars = config.get('num_bars', 1)
-            packet_size = num_bars * self.num_leds * 3
             fps = config.get('fps', 40)
             #Each artnetManger has a property of whether it is in edit_config mode or not.
             edit_config = config.get('edit_config', 1)
             #print(f"edit_config: {edit_config}")
             # Create new Artnet device
-            artnet_device = ArtnetManager(target_ip, packet_size, fps, edit_config = edit_config) 
+            buffer = packet_view[packet_offset:packet_offset + packet_size]
+            packet_offset += packet_size
+            artnet_device = ArtnetManager(target_ip, packet_size, fps, edit_config = edit_config, buffer = buffer, universe = universe, art_sync = art_sync, keepalive = keepalive, protocol = protocol, backend_options = backend_options, bytes_per_pixel = len(pixel_order)) 
+            if not passthrough and num_bars > 0:
+                source = self.bar_bank.output[bank_idx:bank_idx + num_bars]
+                self.device_outputs[artnet_device] = DeviceOutput(source, buffer, num_leds, pixel_order, colour_matrix)
+            if config.get('merge'):
+                self.artnet_input.add_device(artnet_device, config['merge'], config.get('merge_timeout', MERGE_TIMEOUT))
+            if multicast_sacn:
+                device_universes = range(universe, universe + len(artnet_device.backend.universes))
+                for device_universe in device_universes:
+                    if device_universe in sacn_universes:
+                        print(f"Warning: sACN universe {device_universe + 1} of {target_ip} is also sent by {sacn_universes[device_universe]}, give them different universes")
+                    sacn_universes.setdefault(device_universe, target_ip)
+                next_sacn_universe = max(next_sacn_universe, device_universes.stop)
+            artnet_device.start()
             # Add the new Artnet device to the list
             self.artnet_devices.append(artnet_device)
             
@@ -48,13 +126,34 @@ class ArtnetController:
             mode_manager = ModeManager(artnet_device_idx)
             
             # Create new bars for the Artnet device
-            bars = [Bar(colour_manager,mode_manager,artnet_device_idx, self.num_leds) for _ in range(num_bars)]
+            bars = [Bar(colour_manager,mode_manager,artnet_device_idx, num_leds, self.bar_bank, bank_idx + i) for i in range(num_bars)]
+            self.device_rows[artnet_device] = np.arange(bank_idx, bank_idx + num_bars)
+            self.pending_audio[artnet_device] = []
+            bank_idx += num_bars
             self.device_bars_map[artnet_device] = bars
         #print(self.device_bars_map)
+        if self.artnet_input.devices:
+            self.artnet_input.start()
+        #One render loop runs every device at its own fps
+        self.scheduler = FrameScheduler([artnet_device.fps for artnet_device in self.artnet_devices])
+        self.frame_stats = {}      #The scheduler's stats of the last second, set by the artnet thread and shown on the display
         
     def get_esp_config(self):
         with open(self.esp_config_file, 'r') as file:
             return yaml.safe_load(file)
+
+    def get_output_format(self, config):
+        #The LEDs per bar, the order of the channels of each pixel (eg. RGB, GRB or GRBW) and the optional 3x3 colour correction matrix of a device
+        num_leds = config.get('num_leds', self.num_leds)
+        pixel_order = str(config.get('pixel_order', 'RGB')).upper()
+        if not valid_pixel_order(pixel_order):
+            print(f"Invalid pixel order {pixel_order} for {config['target_ip']}, using RGB")
+            pixel_order = 'RGB'
+        colour_matrix = config.get('colour_matrix')
+        if colour_matrix is not None and np.shape(colour_matrix) != (3, 3):
+            print(f"Colour matrix for {config['target_ip']} must be 3x3, ignoring it")
+            colour_matrix = None
+        return num_leds, pixel_order, colour_matrix
         
         
     def update_esp_config(self):
@@ -64,6 +163,7 @@ class ArtnetController:
         #print(f"Current working directory: {current_directory}")
         if os.path.exists(target_file):
             with open(target_file, 'w') as file:
+                file.write(ESP_CONFIG_HEADER)
                 yaml.dump(to_print, file)
             print(f"Config updated: {target_file}")
         else:
@@ -71,12 +171,17 @@ class ArtnetController:
             print("creating file")
             os.makedirs(os.path.dirname(target_file), exist_ok=True)
             with open(target_file, 'w') as file:
+                file.write(ESP_CONFIG_HEADER)
                 yaml.dump(to_print, file)
     
     def dictify_esp_config(self):
         esp_config_list = []
         for config in self.esp_configs:
-            esp_config_list.append({'target_ip': config['target_ip'], 'fps': config['fps'], 'num_bars': config['num_bars'], 'edit_config': config['edit_config']})
+            esp_config = {'target_ip': config['target_ip'], 'fps': config['fps'], 'num_bars': config['num_bars'], 'edit_config': config['edit_config'], 'universe': config.get('universe', 0), 'art_sync': config.get('art_sync', 0), 'keepalive': config.get('keepalive', KEEPALIVE), 'protocol': config.get('protocol', 'artnet'), 'num_leds': config.get('num_leds', self.num_leds), 'pixel_order': config.get('pixel_order', 'RGB')}
+            for key in ['art_sync_target', 'multicast', 'colour_matrix', 'merge', 'merge_timeout']:
+                if key in config:
+                    esp_config[key] = config[key]
+            esp_config_list.append(esp_config)
         return esp_config_list
 
     def update_config(self):
@@ -86,22 +191,22 @@ class ArtnetController:
             self.update_esp_config()
             #first clear the bars. Need to do this because the number of bars may have decreased and then the extra bars which are not recieving data would stay on. 
             print("all devices cleared")
+            self.stop_devices()
             self.clear_all()
             #then reinitialize the devices      
             self.initialize_devices()
     
     
     
-    def clear_all(self):   
+    def stop_devices(self):
+        self.artnet_input.stop()
         for artnet_device in self.artnet_devices:
-            packet = bytearray(artnet_device.packet_size)
-            bars = self.device_bars_map[artnet_device]
-            offset = 0
-            for bar in bars:
-                pixels = bytearray(bar.num_leds)
-                packet[offset:offset + len(pixels)] = pixels
-                offset += len(pixels)
-                artnet_device.send(packet)
+            artnet_device.stop()
+
+    def clear_all(self):   
+        with self.bar_bank.lock:
+            self.bar_bank.output.fill(0)
+        self.send_data()
         
     
     def change_mode(self,mode = 0):
@@ -145,51 +250,74 @@ class ArtnetController:
                 bar.state = "off"
 
     ################################### MAIN LOOP FUNCTION TO UPDATE BARS ####################################################################
-    def update_bars(self, led_queue):
-        start_time = time.time()
-        fft_data = self.process_audio(led_queue)
-        for artnet_device in self.artnet_devices:
-            if self.device_bars_map[artnet_device]:
-                bars = self.device_bars_map[artnet_device]
-                for bar in bars:
-                    bar.update(fft_data)
-        end_time = time.time()
+    def wait_for_frame(self):
+        # Wait for the next frame's deadline, returns the devices due on this frame. Call without holding the lock.
+        scheduler, artnet_devices = self.scheduler, self.artnet_devices
+        return [artnet_devices[idx] for idx in scheduler.wait()]
+
+    def update_bars(self, led_queue, artnet_devices = None):
+        start_time = time.monotonic()
+        #The audio that arrived since the last tick is averaged, as when every device rendered each tick. Every device keeps the
+        #tick's frame until its bars render, so a device below the fastest fps still sees the ticks it was not due on
+        tick_frame = self.process_audio(led_queue)
+        if tick_frame is not None:
+            for artnet_device in self.artnet_devices:
+                self.pending_audio[artnet_device].append(tick_frame)
+        #If artnet_devices is given only their bars are rendered, devices which are no longer configured are ignored
+        if artnet_devices is None:
+            artnet_devices = self.artnet_devices
+        #Devices with the same pending audio (last rendered on the same tick) share the features and render in one pass per mode
+        groups = {}
+        for artnet_device in artnet_devices:
+            if artnet_device not in self.device_rows:
+                continue
+            pending = self.pending_audio[artnet_device]
+            key = (id(pending[0]), len(pending)) if pending else None
+            groups.setdefault(key, []).append(artnet_device)
+        if not groups:
+            return
+        self.bar_bank.update_bands()
+        for group in groups.values():
+            pending = self.pending_audio[group[0]]
+            #A device which skipped ticks takes the max of their frames, so a hit on a skipped tick still triggers its bars
+            if len(pending) > 1:
+                audio_frame = AudioFrame.peak(pending)
+            elif pending:
+                audio_frame = pending[0]
+            else:
+                # Use a default value if no data was available
+                audio_frame = AudioFrame(np.zeros(128))
+            features = self.feature_extractor.extract(audio_frame)
+            self.bar_bank.render(features, np.concatenate([self.device_rows[artnet_device] for artnet_device in group]))
+            for artnet_device in group:
+                self.pending_audio[artnet_device] = []
+        end_time = time.monotonic()
         duration = end_time - start_time
         #print(f"Update duration: {duration:.4f}s")
         
     def process_audio(self, led_queue):
-        fft_data_list = []
-        # Retrieve all values from the queue
+        # Retrieve all frames from the queue
+        frames = []
         while True:
             try:
-                fft_data = led_queue.get_nowait()
-                fft_data_list.append(fft_data)
+                frames.append(led_queue.get_nowait())
             except queue.Empty:
                 break
         # Compute the average if the list is not empty
-        if fft_data_list:
-            fft_data_array = np.array(fft_data_list)
-            avg_fft_data = np.mean(fft_data_array, axis=0)
-            return avg_fft_data
-        else:
-            # Return a default value if no data was available
-            return np.zeros(128)
+        if frames:
+            return AudioFrame.average(frames)
+        return None
 
-    def send_data(self):
+    def send_data(self, artnet_devices = None):
+        #The bars have already rendered into each device's packet buffer, hand each frame to the device's send worker
+        self.frame_generation += 1
         for artnet_device in self.artnet_devices:
-            packet = bytearray(artnet_device.packet_size)
-            bars = self.device_bars_map[artnet_device]
-            offset = 0
-            for bar in bars:
-                pixels = bar.get_pixels()
-                packet[offset:offset + len(pixels)] = pixels
-                offset += len(pixels)
-
-            if len(packet) == artnet_device.packet_size: 
-                artnet_device.send(packet)
-            else:
-                print(f"packet size: {len(packet)}")
-                print(f"declared packet size: {artnet_device.packet_size}") 
+            if artnet_devices is None or artnet_device in artnet_devices:
+                device_output = self.device_outputs.get(artnet_device)
+                if device_output is not None:
+                    device_output.apply()
+                self.artnet_input.merge(artnet_device)
+                artnet_device.submit(self.frame_generation)
         # Timing control is handled in the main loop
     
     ########################################## END OF MAIN LOOP FUNCTIONS ################################################################
@@ -221,6 +349,7 @@ class ArtnetController:
                     bar.mode_manager.remove_auto_cycle_mode(idx)
                 if len(bars) > 0:
                     bars[0].mode_manager.update_mode_config()
+        self.bar_bank.modes_dirty = True
     
     def add_auto_cycle_mode(self,idx):
         for artnet_device in self.artnet_devices:
@@ -230,22 +359,23 @@ class ArtnetController:
                     bar.mode_manager.add_auto_cycle_mode(idx)
                 if len(bars) > 0:
                     bars[0].mode_manager.update_mode_config()
+        self.bar_bank.modes_dirty = True
                 
     
 #############################################################################
    
     #Time per colour
+    #The colours step once per frame, so the steps depend on each device's fps
     def get_time_per_colour(self):
-        steps_per_transisiton = []
+        time_per_colour = []
         for artnet_device in self.artnet_devices:
             bars = self.device_bars_map[artnet_device]
             for bar in bars:
-                steps_per_transisiton.append(bar.steps_per_transition)
-        time_per_colour = int(steps_per_transisiton[0]/self.fps)
-        return time_per_colour
+                time_per_colour.append(int(bar.steps_per_transition/artnet_device.fps))
+        return time_per_colour[0]
     def set_time_per_colour(self,value):
-        steps_per_transition = value*self.fps
         for artnet_device in self.artnet_devices:
+            steps_per_transition = value*artnet_device.fps
             bars = self.device_bars_map[artnet_device]
             for bar in bars:
                 bar.steps_per_transition  = steps_per_transition
@@ -0,0 +1,123 @@
+import socket
+import threading
+import time
+import numpy as np
+from backends import ARTNET_PORT, ARTDMX_HEADER_SIZE, DMX_CHANNELS, get_socket, plan_universes
+
+MERGE_MODES = ['htp', 'ltp']
+MERGE_TIMEOUT = 2.0        #Seconds without data from the console before a universe is handed back to the bars
+
+
+#Listens for ArtDmx from a lighting console and merges it into the devices' packets before they are sent.
+#Each device set to merge takes input on its own universes (the same numbers it sends on), so the console patches our bars as they are.
+#HTP keeps the highest of our level and the console's for every channel, LTP lets the console's levels replace ours.
+#A universe goes back to the bars when the console has not sent it for the timeout.
+#The console only addresses universes, not devices, so a universe is only merged into the first device added on it.
+#The receive thread only copies the data into the universe's buffer, so the render loop never waits on the network.
+class ArtnetInput:
+    def __init__(self, host = '', port = ARTNET_PORT):
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.universes = {}         #universe -> [levels, length, last received time]
+        self.universe_devices = {}  #universe -> the device it is merged into
+        self.devices = {}           #device -> list of (universe, packet view, merge mode, timeout)
+        self.received_packets = 0
+        self.socket = None
+        self.running = False
+        self.thread = None
+
+    def add_device(self, artnet_device, merge_mode, timeout = MERGE_TIMEOUT):
+        # merge_mode is htp or ltp for all of the device's universes, or a list with one mode (htp, ltp or off) per universe
+        packet = np.frombuffer(artnet_device.packet, dtype=np.uint8)
+        universe_size = DMX_CHANNELS // artnet_device.bytes_per_pixel * artnet_device.bytes_per_pixel
+        merges = []
+        for idx, (start, end) in enumerate(plan_universes(artnet_device.packet_size, universe_size)):
+            mode = merge_mode[idx] if isinstance(merge_mode, list) and idx < len(merge_mode) else merge_mode
+            if mode in (None, 'off') or isinstance(mode, list):
+                continue
+            if mode not in MERGE_MODES:
+                print(f"Merge mode {mode} not found, not merging universe {artnet_device.universe + idx}")
+                continue
+            universe = artnet_device.universe + idx
+            other_device = self.universe_devices.setdefault(universe, artnet_device)
+            if other_device is not artnet_device:
+                print(f"Universe {universe} of {artnet_device.target_ip} is already merged into {other_device.target_ip}, not merging it. Give the devices different universes")
+                continue
+            merges.append((universe, packet[start:end], mode, timeout))
+            with self.lock:
+                self.universes.setdefault(universe, [np.zeros(DMX_CHANNELS, dtype=np.uint8), 0, 0.0])
+        self.devices[artnet_device] = merges
+
+    def start(self):
+        if self.thread is not None:
+            return
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind((self.host, self.port))
+            self.socket.settimeout(0.1)
+        except OSError as e:
+            print(f"Could not listen for Art-Net input: {e}")
+            self.socket = None
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='artnet-input', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.running = False
+        self.thread.join()
+        self.thread = None
+        self.socket.close()
+        self.socket = None
+
+    def run(self):
+        buffer = bytearray(ARTDMX_HEADER_SIZE + DMX_CHANNELS)
+        while self.running:
+            try:
+                size, address = self.socket.recvfrom_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                print(f"Error receiving Art-Net input: {e}")
+                continue
+            #Ignore our own packets, if we are sending to a broadcast address they come back to us
+            if address[1] == get_socket().getsockname()[1]:
+                continue
+            self.receive(buffer, size)
+
+    def receive(self, packet, size):
+        # Store the levels of an ArtDmx packet for a universe we are merging, anything else is ignored
+        if size < ARTDMX_HEADER_SIZE or packet[:8] != b'Art-Net\x00' or packet[8:10] != b'\x00\x50':
+            return
+        universe = int.from_bytes(packet[14:16], 'little')
+        length = min(int.from_bytes(packet[16:18], 'big'), size - ARTDMX_HEADER_SIZE, DMX_CHANNELS)
+        with self.lock:
+            state = self.universes.get(universe)
+            if state is None:
+                return
+            state[0][:length] = np.frombuffer(packet, dtype=np.uint8, count=length, offset=ARTDMX_HEADER_SIZE)
+            state[0][length:] = 0
+            state[1] = length
+            state[2] = time.monotonic()
+            self.received_packets += 1
+
+    def merge(self, artnet_device):
+        # Merge the console's levels into the device's packet, for each universe the console is still sending
+        merges = self.devices.get(artnet_device)
+        if not merges:
+            return
+        now = time.monotonic()
+        with self.lock:
+            for universe, ours, mode, timeout in merges:
+                levels, length, last_time = self.universes[universe]
+                if length == 0 or now - last_time > timeout:
+                    continue
+                theirs = levels[:len(ours)]
+                if mode == 'htp':
+                    np.maximum(ours, theirs, out=ours)
+                else:
+                    ours[:] = theirs
@@ -1,61 +1,129 @@
-from stupidArtnet import StupidArtnet
+import threading
+from backends import BACKENDS, KEEPALIVE, ARTNET_PORT, get_socket, make_artsync_packet
+
+ARTSYNC_BROADCAST = '255.255.255.255'
+
+#Sends one ArtSync once every device in sync mode has sent its ArtDmx packets for a frame, so the nodes all latch the frame together.
+#A device which drops a frame reports the newer one, so the sync goes out for the latest frame every device has sent.
+class ArtSync:
+    def __init__(self, target_ip = ARTSYNC_BROADCAST):
+        self.address = (target_ip, ARTNET_PORT)
+        self.packet = make_artsync_packet()
+        self.socket = get_socket()
+        self.lock = threading.Lock()
+        self.sent_generation = {}       #device -> latest frame generation it has sent
+        self.synced_generation = 0
+        self.syncs_sent = 0
+
+    def add_device(self, device):
+        with self.lock:
+            self.sent_generation[device] = self.synced_generation
+
+    def frame_sent(self, device, generation):
+        with self.lock:
+            self.sent_generation[device] = generation
+            generation = min(self.sent_generation.values())
+            if generation <= self.synced_generation:
+                return
+            self.synced_generation = generation
+            try:
+                self.socket.sendto(self.packet, self.address)
+                self.syncs_sent += 1
+            except OSError as e:
+                print(f"Error sending ArtSync: {e}")
+
 
 class ArtnetManager:
-    def __init__(self,target_ip = '255.255.255.255',packet_size = 512,fps = 30,edit_config = False):
-        
+    def __init__(self,target_ip = '255.255.255.255',packet_size = 512,fps = 30,edit_config = False, buffer = None, universe = 0, art_sync = None, keepalive = KEEPALIVE, protocol = 'artnet', backend_options = None, bytes_per_pixel = 3):
+
         ###Artnet settings
         self.packet_size = packet_size
-        self.num_leds = self.packet_size // 3
+        #The DMX data sent each frame, kept for the life of the device. buffer can be a slice of a larger buffer shared with other devices.
+        self.packet = buffer if buffer is not None else memoryview(bytearray(packet_size))
+        self.bytes_per_pixel = bytes_per_pixel     #3 for RGB strips, 4 for RGBW
+        self.num_leds = self.packet_size // bytes_per_pixel
         self.target_ip = target_ip
         self.fps = fps
-        self.num_leds_per_universe = 170
-        self.artnet_instances = []
-        self.pixels_per_universe = 512
-        self.num_universes = self.packet_size // self.pixels_per_universe + 1
-        
+        self.universe = universe        #The first universe of the device, the rest follow on from it
+        self.keepalive = keepalive      #Unchanged universes are skipped, but still sent at least this often (seconds)
+        #The backend packs the data into packets of the device's protocol and sends them
+        self.protocol = protocol
+        self.backend = BACKENDS[protocol](target_ip, packet_size, universe, keepalive, bytes_per_pixel, **(backend_options or {}))
+
         ### Setting for Physical Controller
         self.edit_config = edit_config
-        
-        
-        if self.packet_size != 0:
-            for universe in range(self.num_universes):
-                packet_size = self.pixels_per_universe if universe < self.num_universes - 1 else self.packet_size % self.pixels_per_universe + universe*2
-                self.artnet_instances.append(StupidArtnet(self.target_ip, universe, packet_size ,self.fps,True, True))
-        
-    def send(self, data):
+        #ArtSync coordinator shared by the devices in sync mode, None to output each frame as soon as it arrives
+        self.art_sync = art_sync
+        if self.art_sync is not None:
+            self.art_sync.add_device(self)
+
+        #Send worker, frames are handed over through a one slot mailbox so the render loop never waits on the network.
+        #pending holds the latest frame submitted, sending the frame the worker is sending, they swap when the worker picks one up.
+        self.pending = bytearray(packet_size)
+        self.sending = bytearray(packet_size)
+        self.has_pending = False
+        self.pending_generation = 0
+        self.sending_generation = 0
+        self.frame_ready = threading.Condition()
+        self.running = False
+        self.worker = None
+        self.sent_frames = 0
+        self.dropped_frames = 0     #Frames replaced by a newer one before the worker got to them
+
+    def send(self, data = None):
+        if data is None:
+            data = self.packet
         if self.packet_size == 0: #don't send anything if packet size is 0
-            #print('Packet size must be greater than 0') 
+            #print('Packet size must be greater than 0')
             return
-        
-        for universe, artnet_instance in enumerate(self.artnet_instances):            
-            if universe == 0:
-                start = 0
-                if self.packet_size>self.pixels_per_universe:
-                    end = (universe + 1) * self.pixels_per_universe
-                else:
-                    end = len(data)
-            elif universe < self.num_universes-1:
-                start = universe * self.pixels_per_universe - universe*2 # eg. start = 1 * 512 - 1*2 = 510 (This is because 510//3 = 170 which is the number of complete RGB values per universe. ) 
-                end = (universe + 1) * self.pixels_per_universe - universe*2
-            else:
-                start = universe * self.pixels_per_universe - universe*2
-                end = len(data) 
-            
-            #print('Uni',universe,'start:',start,'end:',end)
-            #print(f'Sending {end-start} pixels to universe {universe}, size is supposed to be {artnet_instance.packet_size}')
-            artnet_instance.send(data[start:end]) 
-            
-            #Man I worked this out but i have forgotten my logic and need to understand it better. 
-            # Okay so there definitely is a bug, the pixels overlap between universes. I think an easy fix may just be to set the number of pixels per universe to 510 instead of 512. Not gonna mess with it now cause I have other more important things to try. 
-            
-            #Eg.
-            #Data len is 1332. 
-            #Uni 0, start: 0, end: 512
-            #Uni 1, start: 510, end: 1022
-            #Uni2, start: 1020, end: 1332
-            #print(f'start: {start}, end: {end}')
-            
-            #LED 170,           LED 171,        LED 172
-            #508, 509, 510,     511, 512, 513,  514, 515, 516
-            #                             511,  512, 513
-            
\ No newline at end of file
+
+        self.backend.send(data)
+
+    ################################### SEND WORKER ####################################################################
+    def start(self):
+        if self.worker is not None:
+            return
+        self.running = True
+        self.worker = threading.Thread(target=self.run, name=f'artnet-{self.target_ip}', daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        if self.worker is None:
+            return
+        with self.frame_ready:
+            self.running = False
+            self.frame_ready.notify()
+        self.worker.join()
+        self.worker = None
+
+    def submit(self, generation = 0):
+        # Hand the current frame to the worker, replacing any frame it has not picked up yet (stale frames are dropped, not queued)
+        if self.worker is None:
+            self.send()
+            self.frame_sent(generation)
+            return
+        with self.frame_ready:
+            if self.has_pending:
+                self.dropped_frames += 1
+            self.pending[:] = self.packet
+            self.pending_generation = generation
+            self.has_pending = True
+            self.frame_ready.notify()
+
+    def frame_sent(self, generation):
+        if self.art_sync is not None:
+            self.art_sync.frame_sent(self, generation)
+
+    def run(self):
+        while True:
+            with self.frame_ready:
+                while self.running and not self.has_pending:
+                    self.frame_ready.wait()
+                if not self.running:
+                    break
+                self.pending, self.sending = self.sending, self.pending
+                self.sending_generation = self.pending_generation
+                self.has_pending = False
+            self.send(self.sending)
+            self.sent_frames += 1
+            self.frame_sent(self.sending_generation)
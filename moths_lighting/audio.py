@@ -2,8 +2,11 @@ import pyaudio
 import numpy as np
 import threading
 import time
-from scipy.signal import butter, lfilter
-from scipy.signal import find_peaks
+from ring_buffer import RingBuffer
+from fft_plan import FFTPlan
+from filter_bank import FilterBank
+from audio_features import AudioFrame
+from onset import OnsetDetector
 
 class AudioProcessor:
     def __init__(self, fft_queue, led_queue, audio_sensitivity=1):
@@ -20,9 +23,20 @@ class AudioProcessor:
         self.lock = threading.Lock()
         # High-pass filter parameters
         self.highpass_cutoff = 20  # Hz
-        self.b, self.a = butter(4, self.highpass_cutoff / (0.5 * self.rate), btype='high', analog=False)
+        #Stateful so the chunks are filtered as one stream, more stages (eg. a low-pass) can be added without costing more per chunk
+        self.filter_bank = FilterBank(self.rate)
+        self.filter_bank.add_stage('highpass', self.highpass_cutoff, order=4)
+        self.max_freq = 5000
+        self.num_bands = 24     #Mel spaced bands sent alongside the FFT bins, from the high-pass cutoff to max_freq
+        self.fft_plan = None
+        self.onset_detector = None
         self.global_max_mag = 0
         self.decay_factor = 0.999 # Decay factor to reduce the max over time
+        #The stream's callback writes into the ring buffer, the audio thread pulls chunk sized hops out of it
+        self.ring_buffer = RingBuffer(self.chunk * 32)     #About 370ms of audio
+        self.max_backlog = self.chunk * 4       #Skip ahead if the analysis falls more than 4 hops behind
+        self.hop = np.zeros(self.chunk, dtype=np.int16)
+        self.input_overflows = 0        #Callbacks where PortAudio reported it had lost input
         
 
     def start_stream(self):
@@ -31,45 +45,62 @@ class AudioProcessor:
                                       channels=self.channels,
                                       rate=self.rate,
                                       input=True,
-                                      frames_per_buffer=self.chunk)
+                                      frames_per_buffer=self.chunk,
+                                      stream_callback=self.stream_callback)
+            self.stream.start_stream()
             print('Audio Stream started successfully')
         except Exception as e:
             print(f'Failed to start audio stream: {e}')
 
+    def stream_callback(self, in_data, frame_count, time_info, status):
+        # Runs on PortAudio's thread, only copies the samples into the ring buffer so it returns as fast as possible
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        self.ring_buffer.write(np.frombuffer(in_data, dtype=np.int16))
+        return (None, pyaudio.paContinue)
+
     def process_audio(self):
-        data = self.stream.read(self.chunk, exception_on_overflow=False)
-        audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-        # Normalize audio data
-        audio_data /= 32768.0
-        # Remove DC offset
-        audio_data -= np.mean(audio_data)
-        # Apply high-pass filter
-        audio_data = lfilter(self.b, self.a, audio_data)
+        # Analyse the next hop from the ring buffer, returns False if a whole hop has not arrived yet
+        if not self.ring_buffer.read(self.hop, self.max_backlog):
+            #Wait for about a quarter of a hop rather than spinning
+            time.sleep(self.chunk / self.rate / 4)
+            return False
+        plan = self.get_fft_plan()
+        audio_data = plan.load(self.hop)
+        # Apply high-pass filter, which also removes the DC offset
+        audio_data[:] = self.filter_bank.process(audio_data)
         # Apply sensitivity
         audio_data *= self.audio_sensitivity
                 
         #Detect beat
         #self.detect_beat(audio_data)
         
-        # Apply window function
-        window = np.hanning(len(audio_data))
-        audio_data *= window
-        
-        # Compute FFT
-        fft_data = np.fft.rfft(audio_data, n=self.num_bins)
-        fft_mag = np.abs(fft_data)
+        # Window and compute FFT
+        fft_mag = plan.transform()
         fft_mag = self.normalise_to_global_max(fft_mag)
-        # Limit to max frequency
-        max_freq = 5000
-        freqs = np.fft.rfftfreq(self.num_bins, 1 / self.rate)
-        idx_max_freq = np.where(freqs <= max_freq)[0][-1]
-        fft_mag = fft_mag[:idx_max_freq + 1]
+        # Limit to max frequency, the plan's buffer is reused next hop so the queues get their own copy
+        fft_mag = fft_mag[:plan.num_outputs].copy()
+        bands = plan.bands(fft_mag)
+        #The hop was captured before the samples still waiting in the ring buffer
+        timestamp = time.monotonic() - self.ring_buffer.available() / self.rate
+        onsets = self.onset_detector.process(bands, timestamp)
+        #Both queues share the frame, the consumers only read it
+        frame = AudioFrame(fft_mag, bands, plan.band_freqs, timestamp, onsets)
         if self.fft_queue:
-            self.fft_queue.put(fft_mag)
+            self.fft_queue.put(frame)
         if self.led_queue:
-            self.led_queue.put(fft_mag)
+            self.led_queue.put(frame)
+        return True
 
 
+    def get_fft_plan(self):
+        # The analysis plan for the current settings, rebuilt only when they change
+        if self.fft_plan is None or not self.fft_plan.matches(self.rate, self.chunk, self.num_bins, self.max_freq, self.num_bands):
+            self.fft_plan = FFTPlan(self.rate, self.chunk, self.num_bins, self.max_freq, self.num_bands, self.highpass_cutoff)
+            #Half a second of hops for the onset threshold
+            self.onset_detector = OnsetDetector(self.num_bands, history=int(0.5 * self.rate / self.chunk))
+        return self.fft_plan
+
     def normalise_to_global_max(self,fft_data):
         
         # Apply the decay to the global max magnitude
@@ -94,6 +125,12 @@ class AudioProcessor:
     
     #Helper Get and Set functions
     
+    def get_capture_stats(self):
+        # How many samples have been lost, either by PortAudio or because the ring buffer was full
+        stats = self.ring_buffer.stats()
+        stats['input_overflows'] = self.input_overflows
+        return stats
+
     def get_scaler(self):
         return self.global_max_mag
     
@@ -0,0 +1,162 @@
+import numpy as np
+import time
+
+MAX_FREQ = 5000            #fft_data contains magnitudes for frequencies up to 5000 Hz
+TRIGGER_STYLES = ["max", "mean", "onset"]
+ONSET_STYLE = TRIGGER_STYLES.index("onset")
+
+
+def trigger_magnitude(data, style_code):
+    # Compute the trigger magnitude of some fft data, either its max or its mean. Onset uses the max, it is zeroed when there is no onset.
+    if len(data) == 0:
+        return 0
+    if TRIGGER_STYLES[int(style_code)] == "mean":
+        return np.mean(data)
+    return np.max(data)
+
+
+#One hop of analysed audio, as put on the fft and led queues by the AudioProcessor.
+#fft_data is the magnitude of each FFT bin up to MAX_FREQ, bands is the compact mel spaced band vector and band_freqs the centre of each band.
+#onsets flags the bands with an onset in this hop, onset_time is when the latest onset was captured (time.monotonic), or None.
+class AudioFrame:
+    def __init__(self, fft_data, bands=None, band_freqs=None, timestamp=None, onsets=None):
+        self.fft_data = fft_data
+        self.bands = bands
+        self.band_freqs = band_freqs
+        self.timestamp = timestamp
+        self.onsets = onsets
+        self.onset_time = timestamp if onsets is not None and onsets.any() else None
+
+    @staticmethod
+    def average(frames):
+        # The mean of several frames, eg. everything queued since the last render. Stamped with the latest frame's time.
+        # A band has an onset if it had one in any of the frames, so no onset is lost when frames are averaged.
+        if len(frames) == 1:
+            return frames[0]
+        last = frames[-1]
+        fft_data = np.mean([frame.fft_data for frame in frames], axis=0)
+        bands = np.mean([frame.bands for frame in frames], axis=0) if last.bands is not None else None
+        onsets = np.any([frame.onsets for frame in frames], axis=0) if all(frame.onsets is not None for frame in frames) else None
+        frame = AudioFrame(fft_data, bands, last.band_freqs, last.timestamp, onsets)
+        frame.onset_time = max((frame.onset_time for frame in frames if frame.onset_time is not None), default=None)
+        return frame
+
+    @staticmethod
+    def peak(frames):
+        # The max of several frames, eg. the frames of the ticks a device skipped, so a hit on any of them still triggers its bars
+        if len(frames) == 1:
+            return frames[0]
+        last = frames[-1]
+        fft_data = np.max([frame.fft_data for frame in frames], axis=0)
+        bands = np.max([frame.bands for frame in frames], axis=0) if last.bands is not None else None
+        onsets = np.any([frame.onsets for frame in frames], axis=0) if all(frame.onsets is not None for frame in frames) else None
+        frame = AudioFrame(fft_data, bands, last.band_freqs, last.timestamp, onsets)
+        frame.onset_time = max((frame.onset_time for frame in frames if frame.onset_time is not None), default=None)
+        return frame
+
+
+#Everything the bars read from the audio for one frame. Computed once by the ArtnetController and shared by every bar.
+class AudioFeatures:
+    def __init__(self, fft_data, magnitudes, energy, levels, timestamp, onsets=None, onset_time=None, onset_bands=None):
+        self.fft_data = fft_data
+        self.magnitudes = magnitudes    #Trigger magnitude of each registered band, indexed by band id
+        self.energy = energy            #Sum of the magnitudes of every bin
+        self.levels = levels            #Trigger magnitude of the whole spectrum, indexed by trigger style
+        self.timestamp = timestamp      #time.monotonic, like the frames' timestamps and onset_time
+        self.onsets = onsets            #True for each registered band with an onset since these bars last rendered, indexed by band id
+        self.onset_time = onset_time    #Capture time (time.monotonic) of the latest onset, None if there was none
+        self.onset_bands = onset_bands  #True for each registered band with the onset trigger style, None when there are no onsets
+
+    def beats(self, band_ids, thresholds):
+        # Beat flags, True where the band's magnitude is over the threshold. Bands with the onset trigger style beat on their onset flag alone.
+        beats = self.magnitudes[band_ids] > thresholds
+        if self.onset_bands is not None:
+            beats = np.where(self.onset_bands[band_ids], self.onsets[band_ids], beats)
+        return beats
+
+    def level_beats(self, style_codes, thresholds):
+        # Beat flags of the whole spectrum for each trigger style code, the onset style beats on an onset in any band
+        beats = self.levels[style_codes] > thresholds
+        if self.onset_bands is not None:
+            beats = np.where(style_codes == ONSET_STYLE, self.onset_time is not None, beats)
+        return beats
+
+    def trigger_times(self, band_ids):
+        # When each band's beat was heard, the capture time of the latest onset for onset style bands with an onset, otherwise timestamp.
+        # Timing from the onset keeps a device which renders later than the hit from holding its debounce for longer.
+        times = np.full(len(band_ids), self.timestamp)
+        if self.onset_bands is not None and self.onset_time is not None:
+            times[self.onset_bands[band_ids] & self.onsets[band_ids]] = self.onset_time
+        return times
+
+
+#Computes the AudioFeatures for the bands the bars are using.
+#A band is read from the fft bins, or from the frame's band vector if it is registered with use_bands (a bar setting). Each band in the
+#band vector is the weighted mean of its bins so it reads lower than the peak bin, and the thresholds need setting lower to trigger as often.
+#The onsets are always read from the band vector, when the frame has one.
+#The slices of each band are cached until the bands, the number of fft bins or the band frequencies change.
+class FeatureExtractor:
+    def __init__(self):
+        self.bands = []            #(lower, upper, trigger style code, use_bands) of each band, the index is the band id
+        self.band_slices = {}      #num_bins or band frequencies -> list of slices, one per band
+
+    def set_bands(self, bands):
+        # Register the bands in use and return the band id of each, bands with the same bounds, style and use_bands share an id
+        keys = [tuple(band) for band in bands]
+        unique = list(dict.fromkeys(keys))
+        if unique != self.bands:
+            self.bands = unique
+            self.band_slices = {}
+        return [self.bands.index(key) for key in keys]
+
+    def get_band_slices(self, num_bins):
+        slices = self.band_slices.get(num_bins)
+        if slices is None:
+            freqs = np.linspace(0, MAX_FREQ, num_bins)
+            slices = []
+            for lower, upper, _, _ in self.bands:
+                indices = np.where((freqs >= lower) & (freqs <= upper))[0]
+                slices.append(slice(indices[0], indices[-1] + 1) if len(indices) > 0 else slice(0, 0))
+            self.band_slices[num_bins] = slices
+        return slices
+
+    def get_band_vector_slices(self, band_freqs):
+        # The slice of the band vector covering each band, the bands with their centre inside the bounds, or the nearest band
+        key = band_freqs.tobytes()
+        slices = self.band_slices.get(key)
+        if slices is None:
+            slices = []
+            for lower, upper, _, _ in self.bands:
+                indices = np.where((band_freqs >= lower) & (band_freqs <= upper))[0]
+                if len(indices) == 0:
+                    indices = [np.argmin(np.abs(band_freqs - (lower + upper) / 2))]
+                slices.append(slice(indices[0], indices[-1] + 1))
+            self.band_slices[key] = slices
+        return slices
+
+    def extract(self, frame):
+        # frame is an AudioFrame, or just the fft data
+        if not isinstance(frame, AudioFrame):
+            frame = AudioFrame(frame)
+        fft_data = frame.fft_data
+        onsets, onset_slices = None, None
+        if frame.bands is not None:
+            onsets, onset_slices = frame.onsets, self.get_band_vector_slices(frame.band_freqs)
+        bin_slices = self.get_band_slices(len(fft_data))
+        magnitudes = np.zeros(len(self.bands), dtype=np.float32)
+        for band_id, (_, _, style, use_bands) in enumerate(self.bands):
+            if use_bands and frame.bands is not None:
+                magnitudes[band_id] = trigger_magnitude(frame.bands[onset_slices[band_id]], style)
+            else:
+                magnitudes[band_id] = trigger_magnitude(fft_data[bin_slices[band_id]], style)
+        levels = np.array([trigger_magnitude(fft_data, style) for style in range(len(TRIGGER_STYLES))])
+        band_onsets, onset_bands = None, None
+        #Bands with the onset trigger style beat on an onset whatever their threshold, their magnitude is zeroed without one.
+        #Without onsets (eg. no band vector) they trigger like max.
+        if onsets is not None:
+            band_onsets = np.array([onsets[band_slice].any() for band_slice in onset_slices], dtype=bool)
+            onset_bands = np.array([style == ONSET_STYLE for _, _, style, _ in self.bands], dtype=bool)
+            magnitudes = np.where(onset_bands & ~band_onsets, 0, magnitudes)
+            if not onsets.any():
+                levels[ONSET_STYLE] = 0
+        return AudioFeatures(fft_data, magnitudes, np.sum(np.abs(fft_data)), levels, time.monotonic(), band_onsets, frame.onset_time, onset_bands)
@@ -0,0 +1,241 @@
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+DMX_CHANNELS = 512          #Channels in a DMX universe, universes carry as many whole pixels as fit (170 RGB or 128 RGBW)
+UNIVERSE_SIZE = 510         #Bytes of pixel data per universe for RGB, 170 whole pixels
+KEEPALIVE = 1.0             #Seconds between full refreshes of universes which have not changed, nodes time out without data
+
+ARTNET_PORT = 6454
+ARTDMX_HEADER_SIZE = 18
+
+DDP_PORT = 4048
+DDP_HEADER_SIZE = 10
+DDP_PACKET_SIZE = 1440      #Bytes of pixel data per DDP packet, 480 whole RGB pixels
+DDP_VERSION = 0x40          #Version 1, in the top two bits of the flags
+DDP_PUSH = 0x01             #Flag telling the receiver to display the data it has received
+DDP_TYPE_RGB8 = 0x0B        #RGB, 8 bits per channel
+DDP_TYPE_RGBW8 = 0x1B       #RGBW, 8 bits per channel
+DDP_DEFAULT_OUTPUT = 0x01   #Destination id of the receiver's default output
+
+SACN_PORT = 5568
+SACN_HEADER_SIZE = 126
+SACN_PRIORITY = 100
+SACN_SOURCE_NAME = "Moths Lighting"
+SACN_CID = uuid.uuid4().bytes   #Identifies this sender to the receivers, one per run
+
+#Every backend sends over this one UDP socket
+_socket = None
+
+def get_socket():
+    global _socket
+    if _socket is None:
+        _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        _socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        _socket.setblocking(True)
+    return _socket
+
+
+def plan_universes(packet_size, universe_size=UNIVERSE_SIZE):
+    # Split the data into (start, end) of each universe, on whole pixel boundaries so no pixel is split or sent twice
+    return [(start, min(start + universe_size, packet_size)) for start in range(0, packet_size, universe_size)]
+
+
+def make_artdmx_header(universe, length):
+    # The 18 byte ArtDmx header, the sequence number (byte 12) is updated when the packet is sent
+    header = bytearray(b'Art-Net\x00')
+    header += (0x5000).to_bytes(2, 'little')        #OpCode ArtDmx, low byte first
+    header += (14).to_bytes(2, 'big')               #Protocol version 14, high byte first
+    header += bytes([0, 0])                         #Sequence, physical port
+    header += (universe & 0x7FFF).to_bytes(2, 'little')  #Port-Address (net, subnet and universe), low byte first
+    header += length.to_bytes(2, 'big')             #Length of the DMX data, high byte first
+    return header
+
+
+def make_artsync_packet():
+    # The 14 byte ArtSync packet, tells the nodes in sync mode to output the ArtDmx data they have received
+    packet = bytearray(b'Art-Net\x00')
+    packet += (0x5200).to_bytes(2, 'little')        #OpCode ArtSync, low byte first
+    packet += (14).to_bytes(2, 'big')               #Protocol version 14, high byte first
+    packet += bytes([0, 0])                         #Aux1, Aux2
+    return packet
+
+
+def make_sacn_header(universe, length):
+    # The 126 byte E1.31 data packet header (root, framing and DMP layers), the sequence number (byte 111) is updated when the packet is sent
+    packet_size = SACN_HEADER_SIZE + length
+    header = bytearray()
+    #Root layer
+    header += (0x0010).to_bytes(2, 'big')           #Preamble size
+    header += (0x0000).to_bytes(2, 'big')           #Postamble size
+    header += b'ASC-E1.17\x00\x00\x00'              #ACN packet identifier
+    header += (0x7000 | (packet_size - 16)).to_bytes(2, 'big')
+    header += (0x00000004).to_bytes(4, 'big')       #VECTOR_ROOT_E131_DATA
+    header += SACN_CID
+    #Framing layer
+    header += (0x7000 | (packet_size - 38)).to_bytes(2, 'big')
+    header += (0x00000002).to_bytes(4, 'big')       #VECTOR_E131_DATA_PACKET
+    header += SACN_SOURCE_NAME.encode('utf8').ljust(64, b'\x00')[:64]
+    header += bytes([SACN_PRIORITY])
+    header += (0).to_bytes(2, 'big')                #Synchronization address, not used
+    header += bytes([0, 0])                         #Sequence, options
+    header += universe.to_bytes(2, 'big')
+    #DMP layer
+    header += (0x7000 | (packet_size - 115)).to_bytes(2, 'big')
+    header += bytes([0x02, 0xA1])                   #VECTOR_DMP_SET_PROPERTY, address and data type
+    header += (0x0000).to_bytes(2, 'big')           #First property address
+    header += (0x0001).to_bytes(2, 'big')           #Address increment
+    header += (length + 1).to_bytes(2, 'big')       #Property value count, the start code and the DMX data
+    header += bytes([0x00])                         #DMX start code
+    return header
+
+
+def make_ddp_header(offset, length, data_type=DDP_TYPE_RGB8):
+    # The 10 byte DDP header, the flags (byte 0) and sequence number (byte 1) are updated when the packet is sent
+    header = bytearray([DDP_VERSION, 0, data_type, DDP_DEFAULT_OUTPUT])
+    header += offset.to_bytes(4, 'big')             #Offset of the data in the receiver's buffer, in bytes
+    header += length.to_bytes(2, 'big')
+    return header
+
+
+def sacn_multicast_address(universe):
+    # The standard multicast group of an E1.31 universe, 239.255.<universe high byte>.<universe low byte>
+    return f'239.255.{universe >> 8}.{universe & 0xFF}'
+
+
+#Packs a device's data into one preallocated packet per universe and sends them over the shared socket.
+#The universes are planned once, on whole pixel boundaries for 3 (RGB) or 4 (RGBW) bytes per pixel, each packet has its header built in and only the sequence number and payload are written when sending.
+#The payload always holds what was last sent, so universes which have not changed are skipped until the keepalive is due.
+class OutputBackend(ABC):
+    header_size = 0
+    sequence_byte = 0       #Index of the sequence number in the header
+    sequence_max = 255      #Sequence numbers run from 1 to sequence_max
+    max_payload = DMX_CHANNELS
+
+    def __init__(self, target_ip, packet_size, universe=0, keepalive=KEEPALIVE, bytes_per_pixel=3):
+        self.target_ip = target_ip
+        self.packet_size = packet_size
+        self.bytes_per_pixel = bytes_per_pixel
+        self.universe_size = self.max_payload // bytes_per_pixel * bytes_per_pixel
+        self.universe = universe        #The first universe of the device, the rest follow on from it
+        self.keepalive = keepalive
+        self.socket = get_socket()
+        self.sequence = 0
+
+        self.universes = []
+        for idx, (start, end) in enumerate(plan_universes(packet_size, self.universe_size)):
+            length = self.payload_length(end - start)
+            packet = bytearray(self.header_size + length)
+            packet[:self.header_size] = self.make_header(idx, start, length)
+            payload = memoryview(packet)[self.header_size:self.header_size + end - start]
+            self.universes.append((packet, payload, start, end, self.address(idx)))
+        self.last_sent_time = [0.0] * len(self.universes)
+        self.sent_universes = 0
+        self.skipped_universes = 0
+
+    def payload_length(self, length):
+        return length
+
+    @abstractmethod
+    def make_header(self, idx, start, length):
+        # The header of the idx'th universe of the device, which carries data[start:start + length]
+        pass
+
+    @abstractmethod
+    def address(self, idx):
+        pass
+
+    def send(self, data):
+        #Sequence runs 1-sequence_max, 0 would tell the receiver sequencing is disabled
+        self.sequence = self.sequence % self.sequence_max + 1
+        now = time.monotonic()
+        for idx in range(len(self.universes)):
+            if self.due(idx, data, now):
+                self.send_universe(idx, data, now)
+            else:
+                self.skipped_universes += 1
+
+    def due(self, idx, data, now):
+        # Skip universes which are the same as last time, unless the keepalive is due
+        _, payload, start, end, _ = self.universes[idx]
+        return payload != data[start:end] or now - self.last_sent_time[idx] >= self.keepalive
+
+    def send_universe(self, idx, data, now):
+        packet, payload, start, end, address = self.universes[idx]
+        packet[self.sequence_byte] = self.sequence
+        payload[:] = data[start:end]
+        try:
+            self.socket.sendto(packet, address)
+            self.last_sent_time[idx] = now
+            self.sent_universes += 1
+        except OSError as e:
+            print(f"Error sending to {address[0]}: {e}")
+            #The payload already holds this frame, so it would compare equal and be skipped, send it again next frame
+            self.last_sent_time[idx] = float('-inf')
+
+
+class ArtnetBackend(OutputBackend):
+    header_size = ARTDMX_HEADER_SIZE
+    sequence_byte = 12
+
+    def payload_length(self, length):
+        return length + length % 2      #The DMX length must be even, the padding byte stays 0
+
+    def make_header(self, idx, start, length):
+        return make_artdmx_header(self.universe + idx, length)
+
+    def address(self, idx):
+        return (self.target_ip, ARTNET_PORT)
+
+
+class SacnBackend(OutputBackend):
+    header_size = SACN_HEADER_SIZE
+    sequence_byte = 111
+
+    def __init__(self, target_ip, packet_size, universe=0, keepalive=KEEPALIVE, bytes_per_pixel=3, multicast=True):
+        self.multicast = multicast      #Send each universe to its multicast group, rather than to target_ip
+        super().__init__(target_ip, packet_size, universe, keepalive, bytes_per_pixel)
+
+    def make_header(self, idx, start, length):
+        #sACN universes start at 1, so Art-Net universe 0 is sACN universe 1
+        return make_sacn_header(self.universe + idx + 1, length)
+
+    def address(self, idx):
+        return (sacn_multicast_address(self.universe + idx + 1) if self.multicast else self.target_ip, SACN_PORT)
+
+
+#DDP carries up to 480 RGB pixels per packet, addressed by byte offset rather than universe, so universe is not used.
+#The push flag is set on the last packet sent each frame so the receiver shows the whole frame at once.
+class DdpBackend(OutputBackend):
+    header_size = DDP_HEADER_SIZE
+    sequence_byte = 1
+    sequence_max = 15       #The sequence number is 4 bits
+    max_payload = DDP_PACKET_SIZE
+
+    def make_header(self, idx, start, length):
+        return make_ddp_header(start, length, DDP_TYPE_RGBW8 if self.bytes_per_pixel == 4 else DDP_TYPE_RGB8)
+
+    def address(self, idx):
+        return (self.target_ip, DDP_PORT)
+
+    def send(self, data):
+        self.sequence = self.sequence % self.sequence_max + 1
+        now = time.monotonic()
+        due = [self.due(idx, data, now) for idx in range(len(self.universes))]
+        self.skipped_universes += due.count(False)
+        if not any(due):
+            return
+        last = len(due) - 1 - due[::-1].index(True)
+        for idx, (packet, _, _, _, _) in enumerate(self.universes):
+            if due[idx]:
+                packet[0] = DDP_VERSION | (DDP_PUSH if idx == last else 0)
+                self.send_universe(idx, data, now)
+
+
+BACKENDS = {
+    'artnet': ArtnetBackend,
+    'sacn': SacnBackend,
+    'ddp': DdpBackend,
+}
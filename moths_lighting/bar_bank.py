@@ -0,0 +1,263 @@
+import numpy as np
+import threading
+import time
+from audio_features import FeatureExtractor
+from output import OutputLUT
+from fade import FadeEngine
+from mode_manager import MODES
+
+#The columns of the bank, every bar gets one entry in each of these arrays.
+#Render state, changes every frame
+STATE_COLUMNS = {
+    'current_step': np.int64,
+    'fade_out_count': np.int64,
+    'start_time': np.float64,
+    'debounce_time': np.float64,
+    'bass_debounce_time': np.float64,
+    'global_magnitude_max': np.float64,
+    'last_time_change': np.float64,
+}
+#Bar config, changes when the user edits it
+CONFIG_COLUMNS = {
+    'steps_per_transition': np.int64,
+    'auto_cycle': np.int64,
+    'time_per_mode': np.int64,
+    'brightness': np.float64,
+    'gamma': np.float64,
+    'fade': np.float64,
+    'fade_out_threshold': np.int64,
+    'length_mid_strobe': np.int64,
+    'trigger_style': np.int64,
+    'use_bands': np.int64,      #1 to read the bass and mid bands from the band vector rather than the fft bins
+    'bass_threshold': np.float64,
+    'bass_lower_bound': np.int64,
+    'bass_upper_bound': np.int64,
+    'mid_threshold': np.float64,
+    'mid_lower_bound': np.int64,
+    'mid_upper_bound': np.int64,
+    'mid_debounce': np.float64,
+    'bass_debounce': np.float64,
+    'colour_offset': np.float64,
+}
+#Columns which make up the inputs of a bar's render, bars with all of these equal (and the same frame) render the same frame
+RENDER_STATE_COLUMNS = [column for column in STATE_COLUMNS if column != 'start_time']
+RENDER_COLUMNS = RENDER_STATE_COLUMNS + [
+    'fade', 'fade_out_threshold', 'length_mid_strobe', 'trigger_style', 'bass_threshold', 'mid_threshold',
+    'bass_debounce', 'mid_debounce', 'bass_band', 'mid_band', 'palette_start', 'palette_length', 'led_count',
+]
+#Ids of the bars' bass and mid bands in the FeatureExtractor, updated when the bounds, trigger style or use_bands change
+BAND_COLUMNS = {
+    'bass_band': np.int64,
+    'mid_band': np.int64,
+}
+
+
+class BankField:
+    """A Bar attribute which is stored in a column of the bar's BarBank."""
+    def __init__(self, column=None, encode=None, decode=None, dirty=None):
+        self.column = column
+        self.encode = encode
+        self.decode = decode
+        self.dirty = dirty      #Name of a flag on the bank to set when the value changes
+
+    def __set_name__(self, owner, name):
+        if self.column is None:
+            self.column = name
+
+    def __get__(self, bar, owner=None):
+        if bar is None:
+            return self
+        value = getattr(bar.bank, self.column)[bar.bank_idx].item()
+        return self.decode(value) if self.decode else value
+
+    def __set__(self, bar, value):
+        getattr(bar.bank, self.column)[bar.bank_idx] = self.encode(value) if self.encode else value
+        if self.dirty:
+            setattr(bar.bank, self.dirty, True)
+
+
+#Holds the state of every bar in struct-of-arrays form so that all bars in the same mode are rendered in one array pass.
+class BarBank:
+    def __init__(self, num_bars, num_leds, feature_extractor=None, output=None, led_count=None):
+        self.num_bars = num_bars
+        self.num_leds = num_leds
+        self.lock = threading.Lock()
+        self.bars = [None] * num_bars
+        self.frames = np.zeros((num_bars, num_leds, 3), dtype=np.uint8)      #Rendered at full brightness by the modes
+        #With brightness and gamma applied, ready to send. output can be a view of the artnet packet buffers so the bars render straight into them
+        self.output = output if output is not None else np.zeros((num_bars, num_leds, 3), dtype=np.uint8)
+        self.output_lut = OutputLUT(num_bars, num_leds)
+        self.lut_dirty = True
+
+        for column, dtype in {**STATE_COLUMNS, **CONFIG_COLUMNS, **BAND_COLUMNS}.items():
+            setattr(self, column, np.zeros(num_bars, dtype=dtype))
+        self.feature_extractor = feature_extractor if feature_extractor is not None else FeatureExtractor()
+        self.bands_dirty = True
+
+        #LED positions along each bar, used by the wave modes and the fades.
+        #led_count is the number of LEDs of each bar, num_leds is the longest bar and the shorter bars are padded to it.
+        self.led_count = np.full(num_bars, num_leds) if led_count is None else np.asarray(led_count)
+        self.led_index = np.arange(num_leds)
+        self.led_positions = self.led_index[np.newaxis, :] / self.led_count[:, np.newaxis]
+        self.fader = FadeEngine(self.led_count, num_leds)
+
+        #Mode instances, created the first time a bar uses them, and the (mode, rows) groups to render each frame
+        self.modes = {}
+        self.active_modes = []
+        self.modes_dirty = True
+        self.created_time = time.monotonic()
+        self.last_render_time = self.created_time
+
+        #Every bar's colour cycle is stored in one array, bar i uses palette[palette_start[i]:palette_start[i] + palette_length[i]]
+        self.palettes = [np.zeros((1, 3), dtype=np.uint8)] * num_bars
+        self.palette = np.zeros((1, 3), dtype=np.uint8)
+        self.palette_start = np.zeros(num_bars, dtype=np.int64)
+        self.palette_length = np.ones(num_bars, dtype=np.int64)
+        self.palettes_dirty = True
+
+    def add_bar(self, bar, idx):
+        self.bars[idx] = bar
+
+    def set_palette(self, idx, all_colours):
+        self.palettes[idx] = all_colours
+        self.palettes_dirty = True
+
+    def build_palette(self):
+        # Bars sharing a colour manager share the same palette array, so each distinct palette is only stored once
+        unique = {}
+        for palette in self.palettes:
+            unique.setdefault(id(palette), palette)
+        lengths = np.array([len(palette) for palette in unique.values()])
+        starts = dict(zip(unique, np.cumsum(lengths) - lengths))
+        self.palette = np.concatenate(list(unique.values()))
+        self.palette_length[:] = [len(palette) for palette in self.palettes]
+        self.palette_start[:] = [starts[id(palette)] for palette in self.palettes]
+        self.palettes_dirty = False
+
+    ################################### RENDERING ####################################################################
+    def render(self, features, rows=None):
+        with self.lock:
+            if self.palettes_dirty:
+                self.build_palette()
+            now = features.timestamp
+            dt = now - self.last_render_time
+            self.last_render_time = now
+            self.update_auto_cycle(now)
+            if self.modes_dirty:
+                self.resolve_modes()
+
+            #Render each mode's bars in one pass, only the selected rows if rows is given
+            if rows is not None:
+                selected = np.zeros(self.num_bars, dtype=bool)
+                selected[rows] = True
+            for mode, mode_rows in self.active_modes:
+                self.render_mode(mode, mode_rows if rows is None else mode_rows[selected[mode_rows]], features, dt)
+
+            #Apply brightness and gamma to every frame
+            if self.lut_dirty:
+                self.output_lut.build(self.brightness, self.gamma)
+                self.lut_dirty = False
+            self.output_lut.apply(self.frames, self.output)
+
+    def render_mode(self, mode, rows, features, dt):
+        # Bars with identical render inputs are only rendered once, then the frame and state are copied to the duplicates
+        unique_rows, inverse = (rows, None) if mode.per_bar_random else self.find_duplicates(mode, rows)
+        mode.rows = unique_rows
+        frame = self.frames[unique_rows]
+        mode.render(frame, features, dt)
+        if inverse is None:
+            self.frames[unique_rows] = frame
+            return
+        source_rows = unique_rows[inverse]
+        self.frames[rows] = frame[inverse]
+        for column in RENDER_STATE_COLUMNS:
+            values = getattr(self, column)
+            values[rows] = values[source_rows]
+        mode.copy_state(rows, source_rows)
+
+    def find_duplicates(self, mode, rows):
+        # Returns the rows to render, and the index into those rows of each row's duplicate (None if there are no duplicates)
+        if len(rows) < 2:
+            return rows, None
+        columns = [getattr(self, column)[rows].astype(np.float64) for column in RENDER_COLUMNS]
+        mode_state = mode.state_key(rows)
+        if mode_state is not None:
+            columns.append(mode_state.astype(np.float64).reshape(len(rows), -1))
+        if mode.uses_frame:
+            columns.append(self.frames[rows].reshape(len(rows), -1))
+        keys = np.ascontiguousarray(np.column_stack(columns))
+
+        # Group the rows by the bytes of their key, a dict of bytes is much faster than np.unique(axis=0) here
+        first = {}
+        inverse = np.array([first.setdefault(key.tobytes(), len(first)) for key in keys])
+        if len(first) == len(rows):
+            return rows, None
+        unique_rows = np.zeros(len(first), dtype=rows.dtype)
+        unique_rows[inverse[::-1]] = rows[::-1]
+        return unique_rows, inverse
+
+    def update_auto_cycle(self, now):
+        # Move the auto cycling bars whose time is up on to their next mode
+        expired = (self.auto_cycle != 0) & (now - self.start_time > self.time_per_mode)
+        for row in np.flatnonzero(expired):
+            if self.bars[row] is not None:
+                self.bars[row].update_auto_cycle(now)
+
+    def resolve_modes(self):
+        # Group the bars by the mode they are in, only when a bar's mode has changed
+        groups = {}
+        for row, bar in enumerate(self.bars):
+            mode_name = bar.get_active_mode_name() if bar is not None else None
+            if mode_name is None:
+                continue
+            if mode_name not in MODES:
+                print(f'Mode {mode_name} not found')
+                continue
+            groups.setdefault(mode_name, []).append(row)
+
+        self.active_modes = []
+        for mode_name, group in groups.items():
+            if mode_name not in self.modes:
+                self.modes[mode_name] = MODES[mode_name](self)
+            self.active_modes.append((self.modes[mode_name], np.array(group)))
+        self.modes_dirty = False
+
+    ########## RENDER HELPERS ############################
+    def advance_step(self, rows):
+        # Increment current_step, and reset if it exceeds the length of all_colours
+        self.current_step[rows] = (self.current_step[rows] + 1) % self.palette_length[rows]
+
+    def colours(self, rows, offset=0):
+        # Get the current colour of each bar, offset along its colour cycle
+        steps = (self.current_step[rows] + offset) % self.palette_length[rows]
+        return self.palette[self.palette_start[rows] + steps]
+
+    def fade_out(self, frame, rows, soft_edges=False, mask=None):
+        # Fade the bars of the frame selected by mask (all of them by default), continuing only while their counter is below the threshold
+        selected = np.ones(len(rows), dtype=bool) if mask is None else mask
+        fading = selected & (self.fade_out_count[rows] < 5 / self.fade[rows])
+        finished = selected & ~fading
+
+        # Reduce each channel (R, G, B) based on the fade parameter (and the sine envelope for soft edges)
+        faded = rows[fading]
+        self.fader.fade(frame, fading, self.fade[faded], faded if soft_edges else None)
+        self.fade_out_count[faded] += 1
+
+        # If the threshold is reached, set pixels to black directly for performance
+        frame[finished] = 0
+        self.advance_step(rows[finished])
+
+    def update_bands(self):
+        # Register every bar's bass and mid band with the feature extractor, only when the bounds have changed
+        if not self.bands_dirty:
+            return
+        bass = zip(self.bass_lower_bound, self.bass_upper_bound, self.trigger_style, self.use_bands)
+        mid = zip(self.mid_lower_bound, self.mid_upper_bound, self.trigger_style, self.use_bands)
+        band_ids = self.feature_extractor.set_bands(list(bass) + list(mid))
+        self.bass_band[:] = band_ids[:self.num_bars]
+        self.mid_band[:] = band_ids[self.num_bars:]
+        self.bands_dirty = False
+
+    def debounced(self, rows, triggered, last_time, debounce, now):
+        # Bars which triggered and have waited longer than their debounce time
+        return triggered & (now - last_time[rows] > debounce[rows])
@@ -0,0 +1,126 @@
+import argparse
+import queue
+import time
+import numpy as np
+from artnet import ArtnetController
+from loopback_receiver import LoopbackReceiver
+from audio_features import AudioFrame
+from fft_plan import FFTPlan
+
+#Drives the real ArtnetController against the LoopbackReceiver, for a range of bars per device, fps and protocols,
+#and reports what is rendered, sent and received so the scaling limits can be found before a show.
+#Run from the same directory as main.py (the bar, colour and mode configs are read from there), eg.
+#python moths_lighting/moths_lighting/benchmark.py --bars 1 5 25 50 --fps 40 60 --protocols artnet ddp
+#Each device sends to its own 127.0.0.x address so the receiver can tell them apart.
+
+
+def make_esp_configs(num_devices, num_bars, fps, protocol, art_sync=False):
+    return [{
+        'target_ip': f'127.0.0.{device + 1}',
+        'fps': fps,
+        'num_bars': num_bars,
+        'edit_config': 1,
+        'universe': 0,
+        'art_sync': int(art_sync),
+        'art_sync_target': '127.0.0.1',     #The receiver's first host, so the syncs are counted
+        'keepalive': 0,         #Send every universe every frame, so sequence gaps are real losses
+        'protocol': protocol,
+        'multicast': 0,
+    } for device in range(num_devices)]
+
+
+def check_payloads(controller, receiver):
+    # Compare the last payload the receiver got for each universe with what the backend last sent
+    wrong = 0
+    for device in controller.artnet_devices:
+        backend = device.backend
+        for idx, (_, payload, start, end, _) in enumerate(backend.universes):
+            if device.protocol == 'ddp':
+                universe = start
+            elif device.protocol == 'sacn':
+                universe = backend.universe + idx + 1
+            else:
+                universe = backend.universe + idx
+            received = receiver.payload(device.target_ip, device.protocol, universe)
+            if received is None or received[:end - start] != payload:
+                wrong += 1
+    return wrong
+
+
+def run(receiver, num_devices, num_bars, fps, protocol, seconds, mode, art_sync=False):
+    controller = ArtnetController(make_esp_configs(num_devices, num_bars, fps, protocol, art_sync))
+    for bar in controller.bar_bank.bars:
+        bar.state = mode    #Set directly rather than with change_mode, which would save it to the bar config
+    led_queue = queue.Queue()
+    plan = FFTPlan(44100, 512, 512, 5000)      #The AudioProcessor's settings, for the band vector
+    receiver.reset()
+
+    render_times = []
+    frame_time = 1 / fps
+    start_time = time.monotonic()
+    deadline = start_time
+    frames = 0
+    while time.monotonic() - start_time < seconds:
+        fft_data = np.random.rand(plan.num_outputs).astype(np.float32) * 5
+        led_queue.put(AudioFrame(fft_data, plan.bands(fft_data), plan.band_freqs, time.monotonic()))
+        render_start = time.monotonic()
+        with controller.lock:
+            controller.update_bars(led_queue)
+            controller.send_data()
+        render_times.append(time.monotonic() - render_start)
+        frames += 1
+        deadline += frame_time
+        time.sleep(max(deadline - time.monotonic(), 0))
+
+    elapsed = time.monotonic() - start_time
+    controller.stop_devices()
+    time.sleep(0.2)     #Let the last packets arrive
+
+    with receiver.lock:
+        universes = [stats for (host, proto, _), stats in receiver.universes.items() if proto == protocol]
+        syncs = sum(count for (host, proto), count in receiver.syncs.items() if proto == protocol)
+    return {
+        'devices': num_devices,
+        'bars': num_bars,
+        'fps': fps,
+        'protocol': protocol,
+        'loop_fps': frames / elapsed,
+        'render_ms': 1000 * np.mean(render_times),
+        'render_max_ms': 1000 * np.max(render_times),
+        'dropped': sum(device.dropped_frames for device in controller.artnet_devices),
+        'universes': len(universes),
+        'rx_fps': min((stats.fps() for stats in universes), default=0),
+        'jitter_ms': 1000 * max((stats.jitter() for stats in universes), default=0),
+        'seq_gaps': sum(stats.sequence_gaps for stats in universes),
+        'wrong': check_payloads(controller, receiver),
+        'syncs': syncs,     #ArtSyncs for Art-Net with --art-sync, pushes for DDP
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Art-Net output against a loopback receiver')
+    parser.add_argument('--devices', type=int, default=4, help='Devices to drive, at most the number of controllers in bar_config.yaml')
+    parser.add_argument('--bars', type=int, nargs='+', default=[1, 5, 10, 25, 50], help='Bars per device')
+    parser.add_argument('--fps', type=int, nargs='+', default=[30, 40, 60])
+    parser.add_argument('--protocols', nargs='+', default=['artnet', 'sacn', 'ddp'])
+    parser.add_argument('--seconds', type=float, default=3, help='Length of each run')
+    parser.add_argument('--mode', type=int, default=3, help='Mode index to run the bars in')
+    parser.add_argument('--art-sync', action='store_true', help='Send an ArtSync after each Art-Net frame, to 127.0.0.1')
+    args = parser.parse_args()
+
+    hosts = [f'127.0.0.{device + 1}' for device in range(args.devices)]
+    receiver = LoopbackReceiver(hosts, args.protocols)
+    receiver.start()
+    columns = ['protocol', 'devices', 'bars', 'fps', 'loop_fps', 'render_ms', 'render_max_ms', 'dropped', 'universes', 'rx_fps', 'jitter_ms', 'seq_gaps', 'wrong', 'syncs']
+    print(''.join(f'{column:>14}' for column in columns))
+    try:
+        for protocol in args.protocols:
+            for num_bars in args.bars:
+                for fps in args.fps:
+                    result = run(receiver, args.devices, num_bars, fps, protocol, args.seconds, args.mode, args.art_sync)
+                    print(''.join(f'{result[column]:>14.2f}' if isinstance(result[column], float) else f'{result[column]:>14}' for column in columns))
+    finally:
+        receiver.stop()
+
+if __name__ == "__main__":
+    main()
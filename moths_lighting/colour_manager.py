@@ -1,6 +1,7 @@
 
 import yaml
 import os
+import numpy as np
 
 class Colour:
     def __init__(self, red, green, blue):
@@ -18,6 +19,8 @@ class ColourManager:
         config = self.get_config()
         #print(f"in colour manager: {config}")
         self.colours = []
+        #Colour cycles shared by all bars of this controller, keyed on (colours, steps_per_transition)
+        self.palette_cache = {}
         
         
         for colour in config:
@@ -42,6 +45,7 @@ class ColourManager:
         #print('in add colour')
         #print(f"len: {len(self.colours)}")
         self.colours.append(colour)
+        self.palette_cache.clear()
        
         
     def remove_colour(self, idx):
@@ -49,16 +53,36 @@ class ColourManager:
         #print(f"idx: {idx}, len: {len(self.colours)}")
         if 0 <= idx < len(self.colours):
             self.colours.pop(idx)
+            self.palette_cache.clear()
             
             
     def update_colour(self, index, colour):
         #print('in update colour')
         #print(f"index: {index}, len: {len(self.colours)}")
         self.colours[index] = colour
+        self.palette_cache.clear()
        
             
     def get_colour_list(self):
         return self.colours
+
+    #Returns the full colour cycle as a read only (N, 3) uint8 array, built once and shared by every bar using it
+    def get_palette(self, steps_per_transition):
+        key = (tuple((colour.red, colour.green, colour.blue) for colour in self.colours), steps_per_transition)
+        palette = self.palette_cache.get(key)
+        if palette is None:
+            palette = self.cycle_colours(key[0], steps_per_transition)
+            palette.setflags(write=False)
+            self.palette_cache[key] = palette
+        return palette
+
+    #Cycle through the colours smoothly, interpolating steps_per_transition colours from each colour to the next
+    def cycle_colours(self, colours, steps_per_transition):
+        colours = np.array(colours, dtype=np.float64).reshape(-1, 3)
+        next_colours = np.roll(colours, -1, axis=0)  # Wrap to the first color after the last
+        t = np.linspace(0, 1, steps_per_transition)[np.newaxis, :, np.newaxis]
+        all_colours = (1 - t) * colours[:, np.newaxis, :] + t * next_colours[:, np.newaxis, :]
+        return all_colours.reshape(-1, 3).astype(np.uint8)
     
     def dictify(self):
         colour_list = []
@@ -3,6 +3,7 @@ import time
 import numpy as np
 
 from colour_manager import Colour
+from audio_features import AudioFrame, TRIGGER_STYLES
 from luma.core.interface.serial import i2c
 from luma.oled.device import ssd1306
 from PIL import Image, ImageDraw, ImageFont
@@ -182,6 +183,7 @@ class Display:
         
         # Initialize MenuManager
         self.showing_fft = False
+        self.showing_stats = None     #The function giving the title and lines of the stats page being shown
         self.menu_manager = MenuManager(self.create_menu_structure())
 
         # Start the display update thread
@@ -201,6 +203,12 @@ class Display:
         def set_brightness(value):
             self.artnet_controller.set_parameter('brightness',value)
        
+        #Gamma options
+        def get_gamma():
+            return self.artnet_controller.get_parameter('gamma')
+        def set_gamma(value):
+            self.artnet_controller.set_parameter('gamma',value)
+
         #Fade options
         def get_fade():
             return self.artnet_controller.get_parameter('fade')
@@ -358,15 +366,16 @@ class Display:
         #Trigger Style
         def get_trigger_style():
             trigger_style = self.artnet_controller.get_parameter('trigger_style')
-            if trigger_style == "max":
-                return 0
-            else:
-                return 1               
+            return TRIGGER_STYLES.index(trigger_style) if trigger_style in TRIGGER_STYLES else 0
         def set_trigger_style(value):
-            if value == 0:
-                self.artnet_controller.set_parameter('trigger_style',"max")
-            elif value == 1:
-                self.artnet_controller.set_parameter("trigger_style","mean")
+            if 0 <= value < len(TRIGGER_STYLES):
+                self.artnet_controller.set_parameter('trigger_style',TRIGGER_STYLES[int(value)])
+
+        #Read the bass and mid bands from the band vector rather than the fft bins
+        def get_use_bands():
+            return self.artnet_controller.get_parameter('use_bands')
+        def set_use_bands(value):
+            self.artnet_controller.set_parameter('use_bands', int(value))
         
         #Bass options
         def get_bass_lower_bound():
@@ -470,11 +479,20 @@ class Display:
         def show_fft_stats():
             self.show_fft_display()
 
+        #Shows the render loop's frame stats
+        def show_frame_stats():
+            self.show_stats_display(self.get_frame_stats)
+
+        #Shows how much audio has been lost before the analysis
+        def show_capture_stats():
+            self.show_stats_display(self.get_capture_stats)
+
         #CONFIGURE MENU STRUCTURE
         # Lighting Options Menu
         lighting_options_menu = Menu("Lighting Options", items=[
             AdjustableMenuItem("Brightness", get_brightness, set_brightness, min_value=0.1, max_value=1, step=0.1),
             AdjustableMenuItem("Fade", get_fade, set_fade, min_value=0.02, max_value=0.2, step=0.01),
+            AdjustableMenuItem("Gamma", get_gamma, set_gamma, min_value=1, max_value=3, step=0.1),
             
             
           
@@ -503,7 +521,8 @@ class Display:
         # Audio Options Menu
         audio_options_menu = Menu("Audio Options", items=[
             AdjustableMenuItem("Sensitivity", get_audio_sensitivity, set_audio_sensitivity, min_value=0, max_value=1, step=0.1),
-            AdjustableMenuItem("Triger Style", get_trigger_style, set_trigger_style, min_value=0, max_value=1, step=1),
+            AdjustableMenuItem("Triger Style", get_trigger_style, set_trigger_style, min_value=0, max_value=len(TRIGGER_STYLES) - 1, step=1),
+            AdjustableMenuItem("Use Bands", get_use_bands, set_use_bands, min_value=0, max_value=1, step=1),
             AdjustableMenuItem("Bass Trigger", get_bass_threshold,  set_bass_threshold, min_value=0, max_value=1, step=0.1),
             AdjustableMenuItem("Bass LB", get_bass_lower_bound, set_bass_lower_bound, min_value=0, max_value=get_bass_upper_bound(), step=10),
             AdjustableMenuItem("Bass UB", get_bass_upper_bound, set_bass_upper_bound, min_value=get_bass_lower_bound(), max_value=300, step=10),
@@ -560,6 +579,8 @@ class Display:
             MenuItem("Bars Per Controller.", submenu=configure_controllers_menu),
             MenuItem("Edit Config", submenu=esp_select_menu),
             MenuItem("Show FFT Stats", action=show_fft_stats),
+            MenuItem("Show Frame Stats", action=show_frame_stats),
+            MenuItem("Show Capture Stats", action=show_capture_stats),
             # Add other main menu items...
         ])
 
@@ -571,13 +592,14 @@ class Display:
         with self.lock:
             delta = position - self.last_position
             self.last_position = position
-            if not self.showing_fft:
+            if not self.showing_fft and self.showing_stats is None:
                 self.menu_manager.on_position_change(delta)
 
     def on_button_push(self):
         with self.lock:
-            if self.showing_fft:
+            if self.showing_fft or self.showing_stats is not None:
                 self.showing_fft = False
+                self.showing_stats = None
             else:
                 self.menu_manager.on_button_push()
 
@@ -595,6 +617,8 @@ class Display:
                 if self.showing_fft:
                     # Render FFT display
                     self.draw_fft_display()
+                elif self.showing_stats is not None:
+                    self.draw_stats_display(*self.showing_stats())
                 else:
                     # Render display based on current menu
                     self.draw_current_menu()
@@ -658,6 +682,15 @@ class Display:
             draw = self.draw_fft_display_inpicture(draw=draw)
             self.device.display(img)
     
+    #FOR SHOWING A PAGE OF STATS, A TITLE AND UP TO 5 LINES
+    def draw_stats_display(self, title, lines):
+        with Image.new("1", (self.device.width, self.device.height)) as img:
+            draw = ImageDraw.Draw(img)
+            draw.text((0, 0), title, font=self.font, fill=255)
+            for idx, line in enumerate(lines):
+                draw.text((0, 12 + idx * 10), line, font=self.font, fill=255)
+            self.device.display(img)
+
     #FOR SHOWING EMBEDDED FFT DISPLAYS.        
     def draw_fft_display_inpicture(self, height = None, width = None, draw = None , y = 0, x = 0):
         
@@ -668,10 +701,15 @@ class Display:
         if width is None:
             width = device.width
         
-        data = self.get_audio_data()
+        #Show the band vector when the bars trigger from it, it is spaced like we hear so the bass gets as much of the screen as the highs
+        frame = self.get_audio_data()
+        if frame.bands is not None and self.artnet_controller.get_parameter('use_bands'):
+            data, freqs = frame.bands, frame.band_freqs
+        else:
+            data, freqs = frame.fft_data, np.linspace(0, 5000, len(frame.fft_data))
 
         max_magnitude = max(data) if np.max(data) > 0 else 1
-        max_freq = self.get_max_freq(data)
+        max_freq = self.get_max_freq(data, freqs)
         
         scaled_magnitude = (data) * (height)
         scaled_magnitude = scaled_magnitude.astype(int)
@@ -686,12 +724,12 @@ class Display:
             
         # Draw the bass threshold line across this frequency range
         threshold_y = y + height - int(self.artnet_controller.get_parameter('bass_threshold')* height)
-        start_pixel, end_pixel = self.calculate_line(data=data, lower_bound=self.artnet_controller.get_parameter('bass_lower_bound'), upper_bound=self.artnet_controller.get_parameter('bass_upper_bound'), width=width)
+        start_pixel, end_pixel = self.calculate_line(freqs=freqs, lower_bound=self.artnet_controller.get_parameter('bass_lower_bound'), upper_bound=self.artnet_controller.get_parameter('bass_upper_bound'), width=width)
         draw.line([(start_pixel, threshold_y), (end_pixel, threshold_y)], fill=255)
         
         # Draw the mid threshold line across this frequency range
         threshold_y = y + height - int(self.artnet_controller.get_parameter('mid_threshold') * height)
-        start_pixel, end_pixel = self.calculate_line(data=data, lower_bound=self.artnet_controller.get_parameter('mid_lower_bound'), upper_bound=self.artnet_controller.get_parameter('mid_upper_bound'), width=width)
+        start_pixel, end_pixel = self.calculate_line(freqs=freqs, lower_bound=self.artnet_controller.get_parameter('mid_lower_bound'), upper_bound=self.artnet_controller.get_parameter('mid_upper_bound'), width=width)
         draw.line([(start_pixel, threshold_y), (end_pixel, threshold_y)], fill=255)
 
         draw.text((60, 10), f"max freq: {max_freq:.2f} Hz", font=self.font, fill=255)
@@ -700,12 +738,11 @@ class Display:
         return draw
 
     #HELPER FUNCTION TO CALCULATE THE LINE TO DISPLAY THRESHOLDS        
-    def calculate_line(self, data, lower_bound, upper_bound, width):
-        # Determine frequency resolution and find indices for 0-200 Hz
-        fft_length = len(data)
-        frequency_resolution = 5000 / fft_length
-        max_index = int(upper_bound / frequency_resolution)
-        min_index = int(lower_bound / frequency_resolution)
+    def calculate_line(self, freqs, lower_bound, upper_bound, width):
+        # Find the indices of the bounds in the frequency of each bin or band
+        fft_length = len(freqs)
+        max_index = int(np.searchsorted(freqs, upper_bound))
+        min_index = int(np.searchsorted(freqs, lower_bound))
         
         # Map to pixel coordinates  
         start_pixel = int(min_index / fft_length * width)
@@ -722,10 +759,9 @@ class Display:
             results_buffer.append(fft_data)
 
         if results_buffer:
-            fft_array = np.mean(np.array(results_buffer), axis=0)
-            data = fft_array
+            data = AudioFrame.average(results_buffer)
         else:
-            data = np.zeros(64)
+            data = AudioFrame(np.zeros(64))
         return data
 
     
@@ -736,11 +772,9 @@ class Display:
         #   self.audio_processor.set_scaler()
         
     #GET THE MAX FREQUENCY FROM THE DATA
-    def get_max_freq(self, data):
-        fft_length = len(data)
-        frequency_resolution = 5000 / fft_length
+    def get_max_freq(self, data, freqs):
         max_index = np.argmax(data)
-        max_freq = max_index * frequency_resolution
+        max_freq = freqs[max_index]
         return max_freq
     #GET THE FPS FROM THE QUEUE
     def get_fps(self, fps_queue):
@@ -752,5 +786,30 @@ class Display:
     def show_fft_display(self):
         self.showing_fft = True
 
+    def show_stats_display(self, get_stats):
+        self.showing_stats = get_stats
+
+    #THE FRAME STATS OF THE LAST SECOND, SET BY THE ARTNET THREAD
+    def get_frame_stats(self):
+        stats = self.artnet_controller.frame_stats
+        return "Frame Stats (last sec)", [
+            f"Artnet fps: {self.artnet_fps}",
+            f"Late frames: {stats.get('late_frames', 0)}",
+            f"Dropped frames: {stats.get('dropped_frames', 0)}",
+            f"Jitter: {stats.get('jitter_ms', 0):.2f} ms",
+            f"Max late: {stats.get('max_lateness_ms', 0):.2f} ms",
+        ]
+
+    #THE AUDIO LOST SINCE THE STREAM STARTED
+    def get_capture_stats(self):
+        stats = self.audio_processor.get_capture_stats()
+        return "Capture Stats (total)", [
+            f"Input overflows: {stats['input_overflows']}",
+            f"Buffer overruns: {stats['overruns']}",
+            f"Dropped samples: {stats['dropped_samples']}",
+            f"Skipped samples: {stats['skipped_samples']}",
+            f"Backlog: {stats['backlog']} samples",
+        ]
+
     def clear(self):
         self.device.clear()
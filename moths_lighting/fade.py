@@ -0,0 +1,39 @@
+import numpy as np
+
+FADE_SHIFT = 8                 #Fades are fixed point, 1 << FADE_SHIFT is a factor of 1
+FADE_ONE = 1 << FADE_SHIFT
+
+
+#Sine soft edge envelopes, a half sine wave across the bar, as fixed point. Built once per LED count.
+_envelopes = {}
+
+def sine_envelope(led_count):
+    envelope = _envelopes.get(led_count)
+    if envelope is None:
+        envelope = np.round(FADE_ONE * np.sin(np.linspace(0, np.pi, led_count))).astype(np.uint32)
+        envelope.setflags(write=False)
+        _envelopes[led_count] = envelope
+    return envelope
+
+
+#Fades the frames of a BarBank with integer maths, each channel is multiplied by a fixed point factor and shifted back down.
+class FadeEngine:
+    def __init__(self, led_count, num_leds):
+        #The soft edge envelope of every bar, LEDs past the end of a shorter bar are zero
+        self.envelope = np.zeros((len(led_count), num_leds), dtype=np.uint32)
+        for row, count in enumerate(led_count):
+            self.envelope[row, :count] = sine_envelope(int(count))
+
+    def factors(self, fade):
+        # The fixed point factor of each bar for its fade
+        return np.round((1 - fade) * FADE_ONE).astype(np.uint32)
+
+    def fade(self, frame, mask, fade, envelope_rows=None):
+        # Fade the bars of the frame selected by mask, with the soft edge envelope of envelope_rows if given
+        factor = self.factors(fade)[:, np.newaxis]
+        if envelope_rows is not None:
+            factor = (factor * self.envelope[envelope_rows]) >> FADE_SHIFT
+        faded = frame[mask].astype(np.uint16)
+        faded *= factor.astype(np.uint16)[:, :, np.newaxis]
+        faded >>= FADE_SHIFT
+        frame[mask] = faded
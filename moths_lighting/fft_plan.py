@@ -0,0 +1,71 @@
+import numpy as np
+import scipy.fft
+
+
+def hz_to_mel(freq):
+    return 2595 * np.log10(1 + np.asarray(freq) / 700)
+
+
+def mel_to_hz(mel):
+    return 700 * (10 ** (np.asarray(mel) / 2595) - 1)
+
+
+def make_band_matrix(freqs, num_bands, min_freq, max_freq):
+    # Weights of overlapping triangular bands, evenly spaced on the mel scale from min_freq to max_freq, over the bins at freqs.
+    # Each row sums to 1 so a band is the weighted mean of its bins. Returns (matrix, centre frequency of each band).
+    edges = mel_to_hz(np.linspace(hz_to_mel(min_freq), hz_to_mel(max_freq), num_bands + 2))
+    matrix = np.zeros((num_bands, len(freqs)), dtype=np.float32)
+    for band in range(num_bands):
+        lower, centre, upper = edges[band:band + 3]
+        rising = (freqs - lower) / (centre - lower)
+        falling = (upper - freqs) / (upper - centre)
+        matrix[band] = np.clip(np.minimum(rising, falling), 0, None)
+        #Low bands can be narrower than a bin and fall between two, they take the nearest bin instead
+        if matrix[band].sum() == 0:
+            matrix[band, np.argmin(np.abs(freqs - centre))] = 1
+    matrix /= matrix.sum(axis=1, keepdims=True)
+    return matrix, edges[1:-1].astype(np.float32)
+
+#Everything the FFT analysis needs for one (rate, chunk, num_bins, max_freq, num_bands), built once so nothing is recomputed per hop.
+#Holds the window, the frequency axis and the bin cut-off at max_freq, and preallocated float32 buffers the chain runs in place in.
+#The band matrix turns the bins up to max_freq into num_bands mel spaced bands with one matmul. It is mostly zeros, but at this size
+#a dense matmul is quicker than a sparse one.
+#scipy.fft keeps float32 input in single precision (numpy's rfft always works in float64), only its complex output is allocated per hop.
+class FFTPlan:
+    def __init__(self, rate, chunk, num_bins, max_freq, num_bands=24, min_freq=20):
+        self.rate = rate
+        self.chunk = chunk
+        self.num_bins = num_bins
+        self.max_freq = max_freq
+        self.window = np.hanning(chunk).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(num_bins, 1 / rate).astype(np.float32)
+        self.num_outputs = int(np.where(self.freqs <= max_freq)[0][-1]) + 1     #Bins up to and including max_freq
+        self.scale = np.float32(1 / 32768)
+        self.samples = np.zeros(chunk, dtype=np.float32)
+        self.padded = np.zeros(num_bins, dtype=np.float32)      #The windowed samples, zero padded to the FFT size
+        self.magnitudes = np.zeros(num_bins // 2 + 1, dtype=np.float32)
+        self.num_bands = num_bands
+        self.band_matrix, self.band_freqs = make_band_matrix(self.freqs[:self.num_outputs], num_bands, min_freq, max_freq)
+
+    def matches(self, rate, chunk, num_bins, max_freq, num_bands=24):
+        return (self.rate, self.chunk, self.num_bins, self.max_freq, self.num_bands) == (rate, chunk, num_bins, max_freq, num_bands)
+
+    def load(self, hop):
+        # Convert a hop of int16 samples to floats in -1 to 1. Returns the samples buffer.
+        #The DC offset is left for the high-pass filter, removing each hop's mean would put a step between hops
+        samples = self.samples
+        np.multiply(hop, self.scale, out=samples)
+        return samples
+
+    def transform(self):
+        # Window the samples and return the magnitude of every bin, in the plan's magnitudes buffer. Bins past num_outputs are over max_freq.
+        padded = self.padded
+        chunk = min(self.chunk, self.num_bins)
+        np.multiply(self.samples[:chunk], self.window[:chunk], out=padded[:chunk])
+        spectrum = scipy.fft.rfft(padded)
+        np.abs(spectrum, out=self.magnitudes)
+        return self.magnitudes
+
+    def bands(self, magnitudes):
+        # The band vector of the magnitudes of the bins up to max_freq
+        return self.band_matrix @ magnitudes[:self.num_outputs]
@@ -0,0 +1,43 @@
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+FILTER_TYPES = ['highpass', 'lowpass', 'bandpass', 'bandstop']
+
+
+#A chain of Butterworth filters run as one cascade of second-order sections, in float32.
+#The filter state (zi) is carried from one chunk to the next, so the audio is filtered as one continuous stream
+#with no transient at the start of each chunk. Every stage is in the one sos array, so adding stages does not add any Python work per chunk.
+class FilterBank:
+    def __init__(self, rate):
+        self.rate = rate
+        self.stages = []        #(filter type, cutoff, order) of each stage
+        self.sos = np.zeros((0, 6), dtype=np.float32)
+        self.zi = np.zeros((0, 2), dtype=np.float32)
+
+    def add_stage(self, filter_type, cutoff, order=4):
+        # cutoff is in Hz, a (low, high) pair for bandpass and bandstop
+        if filter_type not in FILTER_TYPES:
+            print(f"Filter type {filter_type} not found")
+            return
+        nyquist = 0.5 * self.rate
+        wn = [f / nyquist for f in cutoff] if isinstance(cutoff, (list, tuple)) else cutoff / nyquist
+        sos = butter(order, wn, btype=filter_type, output='sos')
+        self.stages.append((filter_type, cutoff, order))
+        self.sos = np.concatenate([self.sos, sos.astype(np.float32)])
+        self.reset()
+
+    def reset(self):
+        # Start the filters from rest, zi is scaled by the first sample when filtering starts
+        self.zi = np.zeros((len(self.sos), 2), dtype=np.float32)
+        self.started = False
+
+    def process(self, samples):
+        # Filter a chunk, carrying on from the end of the last one. Returns the filtered chunk, in float32.
+        if len(self.sos) == 0:
+            return samples
+        if not self.started:
+            #Start in the steady state for the first sample, so there is no step at the start of the stream either
+            self.zi = (sosfilt_zi(self.sos) * samples[0]).astype(np.float32)
+            self.started = True
+        filtered, self.zi = sosfilt(self.sos, samples, zi=self.zi)
+        return filtered
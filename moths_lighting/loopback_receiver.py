@@ -0,0 +1,212 @@
+import argparse
+import selectors
+import socket
+import threading
+import time
+from backends import ARTNET_PORT, SACN_PORT, DDP_PORT, ARTDMX_HEADER_SIZE, SACN_HEADER_SIZE, DDP_HEADER_SIZE, DDP_PUSH
+from backends import ArtnetBackend, SacnBackend, DdpBackend
+
+#A receiver for testing the output without the ESPs. Listens on localhost for every backend's protocol,
+#decodes the packets and keeps frame rate, jitter, sequence gap and payload stats for each universe.
+#Point the devices in esp_config at 127.0.0.1 (sACN with multicast: 0), or at 127.0.0.x to tell devices apart.
+#Run it on its own with: python loopback_receiver.py --hosts 127.0.0.1 --seconds 10
+PORTS = {
+    'artnet': ARTNET_PORT,
+    'sacn': SACN_PORT,
+    'ddp': DDP_PORT,
+}
+SEQUENCE_MAX = {
+    'artnet': ArtnetBackend.sequence_max,
+    'sacn': SacnBackend.sequence_max,
+    'ddp': DdpBackend.sequence_max,
+}
+
+
+class UniverseStats:
+    def __init__(self, sequence_max):
+        self.sequence_max = sequence_max
+        self.frames = 0
+        self.first_time = None
+        self.last_time = None
+        self.interval_sum = 0.0
+        self.interval_sum_sq = 0.0
+        self.max_interval = 0.0
+        self.sequence = None
+        self.sequence_gaps = 0      #Packets missed (or skipped by the sender), going by the sequence numbers
+        self.out_of_order = 0
+        self.payload = b''          #The latest payload, to check against what was sent
+
+    def add(self, now, sequence, payload):
+        if self.last_time is not None:
+            interval = now - self.last_time
+            self.interval_sum += interval
+            self.interval_sum_sq += interval * interval
+            self.max_interval = max(self.max_interval, interval)
+        else:
+            self.first_time = now
+        self.last_time = now
+        self.frames += 1
+
+        #Sequence 0 means the sender is not using sequence numbers
+        if sequence and self.sequence:
+            gap = (sequence - self.sequence % self.sequence_max - 1) % self.sequence_max
+            if gap > self.sequence_max // 2:
+                self.out_of_order += 1
+            else:
+                self.sequence_gaps += gap
+        self.sequence = sequence
+        self.payload = payload
+
+    def fps(self):
+        if self.frames < 2 or self.last_time == self.first_time:
+            return 0.0
+        return (self.frames - 1) / (self.last_time - self.first_time)
+
+    def jitter(self):
+        # Standard deviation of the time between frames, in seconds
+        intervals = self.frames - 1
+        if intervals < 2:
+            return 0.0
+        mean = self.interval_sum / intervals
+        return max(self.interval_sum_sq / intervals - mean * mean, 0.0) ** 0.5
+
+
+def decode(protocol, packet):
+    # Returns (universe, sequence, payload, is_sync) of a packet, or None if it is malformed.
+    # universe is the universe number for Art-Net and sACN, the byte offset for DDP.
+    if protocol == 'artnet':
+        if len(packet) < 12 or packet[:8] != b'Art-Net\x00':
+            return None
+        opcode = int.from_bytes(packet[8:10], 'little')
+        if opcode == 0x5200:
+            return None, 0, b'', True
+        if opcode != 0x5000 or len(packet) < ARTDMX_HEADER_SIZE:
+            return None
+        length = int.from_bytes(packet[16:18], 'big')
+        if length != len(packet) - ARTDMX_HEADER_SIZE:
+            return None
+        return int.from_bytes(packet[14:16], 'little'), packet[12], packet[ARTDMX_HEADER_SIZE:], False
+    if protocol == 'sacn':
+        if len(packet) < SACN_HEADER_SIZE or packet[4:16] != b'ASC-E1.17\x00\x00\x00':
+            return None
+        count = int.from_bytes(packet[123:125], 'big')
+        if (int.from_bytes(packet[16:18], 'big') & 0x0FFF) != len(packet) - 16 or count != len(packet) - SACN_HEADER_SIZE + 1:
+            return None
+        return int.from_bytes(packet[113:115], 'big'), packet[111], packet[SACN_HEADER_SIZE:], False
+    if protocol == 'ddp':
+        if len(packet) < DDP_HEADER_SIZE or packet[0] & 0xC0 != 0x40:
+            return None
+        length = int.from_bytes(packet[8:10], 'big')
+        if length != len(packet) - DDP_HEADER_SIZE:
+            return None
+        return int.from_bytes(packet[4:8], 'big'), packet[1] & 0x0F, packet[DDP_HEADER_SIZE:], bool(packet[0] & DDP_PUSH)
+    return None
+
+
+class LoopbackReceiver:
+    def __init__(self, hosts = ('127.0.0.1',), protocols = ('artnet', 'sacn', 'ddp')):
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        for host in hosts:
+            for protocol in protocols:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+                sock.bind((host, PORTS[protocol]))
+                sock.setblocking(False)
+                self.selector.register(sock, selectors.EVENT_READ, (host, protocol))
+                self.sockets.append(sock)
+        self.lock = threading.Lock()
+        self.universes = {}     #(host, protocol, universe) -> UniverseStats
+        self.syncs = {}         #(host, protocol) -> number of ArtSyncs or DDP pushes
+        self.malformed = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for sock in self.sockets:
+            self.selector.unregister(sock)
+            sock.close()
+        self.sockets = []
+
+    def reset(self):
+        with self.lock:
+            self.universes = {}
+            self.syncs = {}
+            self.malformed = 0
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.1):
+                while True:
+                    try:
+                        packet = key.fileobj.recv(2048)
+                    except BlockingIOError:
+                        break
+                    self.receive(key.data, packet, time.monotonic())
+
+    def receive(self, source, packet, now):
+        host, protocol = source
+        decoded = decode(protocol, packet)
+        with self.lock:
+            if decoded is None:
+                self.malformed += 1
+                return
+            universe, sequence, payload, is_sync = decoded
+            if is_sync:
+                self.syncs[source] = self.syncs.get(source, 0) + 1
+            if universe is None:
+                return
+            key = (host, protocol, universe)
+            if key not in self.universes:
+                self.universes[key] = UniverseStats(SEQUENCE_MAX[protocol])
+            self.universes[key].add(now, sequence, payload)
+
+    def payload(self, host, protocol, universe):
+        with self.lock:
+            stats = self.universes.get((host, protocol, universe))
+            return stats.payload if stats is not None else None
+
+    def report(self):
+        with self.lock:
+            lines = [f"{'host':<12}{'proto':<8}{'universe':>9}{'frames':>8}{'fps':>8}{'jitter ms':>11}{'max gap ms':>12}{'seq gaps':>10}{'reorder':>9}"]
+            for (host, protocol, universe), stats in sorted(self.universes.items()):
+                lines.append(f"{host:<12}{protocol:<8}{universe:>9}{stats.frames:>8}{stats.fps():>8.1f}{stats.jitter() * 1000:>11.2f}"
+                             f"{stats.max_interval * 1000:>12.2f}{stats.sequence_gaps:>10}{stats.out_of_order:>9}")
+            for (host, protocol), count in sorted(self.syncs.items()):
+                lines.append(f"{host:<12}{protocol:<8}{'syncs':>9}{count:>8}")
+            lines.append(f"malformed packets: {self.malformed}")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Receive Art-Net, sACN and DDP on localhost and report what arrives')
+    parser.add_argument('--hosts', nargs='+', default=['127.0.0.1'])
+    parser.add_argument('--protocols', nargs='+', default=list(PORTS), choices=list(PORTS))
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between reports')
+    args = parser.parse_args()
+
+    receiver = LoopbackReceiver(args.hosts, args.protocols)
+    receiver.start()
+    end_time = time.monotonic() + args.seconds
+    try:
+        while time.monotonic() < end_time:
+            time.sleep(min(args.interval, max(end_time - time.monotonic(), 0)))
+            print(receiver.report())
+            print()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.stop()
+
+if __name__ == "__main__":
+    main()
@@ -21,34 +21,32 @@ fft_fps_queue = Queue()   #this queue is used to store how many frames of FFT ar
 def artnet_thread(artnet_controller, led_queue):
     print('Starting the Artnet Thread')
     send_count = 0
-    start_time = time.time()
+    start_time = time.monotonic()
     loop_durations = deque(maxlen=1000)  
     
     while not stop_flag.is_set():
-        
+        #Sleep until the next frame's deadline, each device is only due at its own fps
+        artnet_devices = artnet_controller.wait_for_frame()
+
         with artnet_controller.lock:
-            iteration_start_time = time.time()
+            iteration_start_time = time.monotonic()
             #print("updating and sending data")
-            update_start_time = time.time()
-            artnet_controller.update_bars(led_queue)
-            update_end_time = time.time()
+            update_start_time = time.monotonic()
+            artnet_controller.update_bars(led_queue, artnet_devices)
+            update_end_time = time.monotonic()
             
-            send_start_time = time.time()
-            artnet_controller.send_data()
-            send_end_time = time.time()
+            send_start_time = time.monotonic()
+            artnet_controller.send_data(artnet_devices)
+            send_end_time = time.monotonic()
 
-        iteration_end_time = time.time()
+        iteration_end_time = time.monotonic()
         loop_duration = iteration_end_time - iteration_start_time
         loop_durations.append(loop_duration)
         
-        computation_time = iteration_end_time - iteration_start_time
-        sleep_time = max(1/artnet_controller.esp_configs[0]['fps'] - computation_time, 0)
-        time.sleep(sleep_time)
-        
         send_count += 1
 
         # Calculate FPS every second
-        current_time = time.time()
+        current_time = time.monotonic()
         if current_time - start_time >= 1.0:
             # Calculate statistics
             avg_loop_duration = sum(loop_durations) / len(loop_durations)
@@ -60,26 +58,28 @@ def artnet_thread(artnet_controller, led_queue):
             # Log the statistics
             #print(f"FPS: {send_count}, Avg Loop Duration: {avg_loop_duration:.4f}s, Max: {max_loop_duration:.4f}s, Min: {min_loop_duration:.4f}s")
             #print(f"Update Duration: {update_duration:.4f}s, Send Duration: {send_duration:.4f}s")
+            artnet_controller.frame_stats = artnet_controller.scheduler.stats()
 
             artnet_fps_queue.put(send_count)  # Send FPS to the display
             send_count = 0
             start_time = current_time
 
     artnet_controller.end_mode()
+    artnet_controller.stop_devices()
 
 def audio_thread(audio_processor):
     print('Starting the Audio Thread')
     audio_processor.start_stream()
 
     send_count = 0
-    start_time = time.time()
+    start_time = time.monotonic()
 
     while not stop_flag.is_set():
-        audio_processor.process_audio()
-        send_count += 1
+        if audio_processor.process_audio():
+            send_count += 1
 
         # Calculate FPS every second
-        current_time = time.time()
+        current_time = time.monotonic()
         if current_time - start_time >= 1.0:
             fft_fps_queue.put(send_count)  # Send FPS to the display
             send_count = 0
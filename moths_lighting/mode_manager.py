@@ -1,24 +1,256 @@
 import yaml
 import os 
+import numpy as np
+from abc import ABC, abstractmethod
+from waves import WaveSynth
+
+DECAY_FACTOR = 0.999       #Decay of the pulse mode's running max
+SINE_FREQUENCY = 4         #Frequency of the sine wave mode
+DISPLAY_COLOUR = "Display Colour"
+
+############### MODES ####################################
+#Every mode is a class registered by name. One instance is made per BarBank, the first time a bar uses the mode,
+#and renders all of the bars in that mode (self.rows of the bank) in one pass. frame is those bars' frames,
+#features is the frame's AudioFeatures and dt is the time in seconds since the previous frame.
+#Per bar state lives in the bank's columns, per mode state lives in the mode's slots.
+MODES = {}
+
+def register_mode(mode_class):
+    MODES[mode_class.name] = mode_class
+    return mode_class
+
+
+class Mode(ABC):
+    __slots__ = ('bank', 'rows')
+    name = None
+    audio_reactive = True
+    in_menu = True          #Whether the mode is listed in the mode menu
+    per_bar_random = False  #Modes with randomness per bar are never rendered once and shared between bars
+    uses_frame = True       #Whether the render builds on the previous frame, rather than overwriting it
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    @abstractmethod
+    def render(self, frame, features, dt):
+        pass
+
+    def state_key(self, rows):
+        # Any per bar state kept by the mode, so that bars are only shared when it is equal
+        return None
+
+    def copy_state(self, rows, source_rows):
+        # Copy the per bar state of the mode from source_rows to rows, after a shared render
+        pass
+
+
+class WaveMode(Mode):
+    __slots__ = ('wave',)
+
+    def state_key(self, rows):
+        return self.wave.phase[rows]
+
+    def copy_state(self, rows, source_rows):
+        self.wave.phase[rows] = self.wave.phase[source_rows]
+
+
+##ADD MODES HERE ONCE YOU MAKE THEM##
+@register_mode
+class DisplayColour(Mode):
+    __slots__ = ()
+    name = DISPLAY_COLOUR
+    audio_reactive = False
+    in_menu = False
+    uses_frame = False
+
+    def render(self, frame, features, dt):
+        bars = [self.bank.bars[row] for row in self.rows]
+        frame[:] = np.array([[bar.colour.red, bar.colour.green, bar.colour.blue] for bar in bars])[:, np.newaxis, :]
+
+
+@register_mode
+class Static(Mode):
+    __slots__ = ()
+    name = "Static"
+    audio_reactive = False
+    uses_frame = False
+
+    def render(self, frame, features, dt):
+        frame[:] = self.bank.colours(self.rows)[:, np.newaxis, :]
+        self.bank.advance_step(self.rows)
+
+
+@register_mode
+class Pulse(Mode):
+    __slots__ = ()
+    name = "Pulse"
+
+    def render(self, frame, features, dt):
+        bank, rows = self.bank, self.rows
+        # Simple pulsing effect
+        energy = features.energy
+        bank.advance_step(rows)
+
+        # Determine maximum magnitude (apply decay if needed)
+        magnitude_max = bank.global_magnitude_max[rows]
+        magnitude_max = np.where(energy > magnitude_max, energy, magnitude_max * DECAY_FACTOR)
+        bank.global_magnitude_max[rows] = magnitude_max
+
+        # Number of LEDs that should be lit, based on the current magnitude as a ratio of the max magnitude
+        level = np.divide(energy, magnitude_max, out=np.zeros(len(rows)), where=magnitude_max > 0)
+        num_leds_on = (level * bank.led_count[rows]).astype(int)
+
+        beat = features.level_beats(bank.trigger_style[rows], bank.bass_threshold[rows] * 0.5)
+        beat_rows = rows[beat]
+        # Reset the fade out count to allow further fading
+        bank.fade_out_count[beat_rows] = (bank.fade_out_threshold[beat_rows] / 10).astype(int)
+        # Keep the faded LEDs and light up only the LEDs that are supposed to be on
+        lit = bank.led_index < num_leds_on[beat, np.newaxis]
+        colours = bank.colours(beat_rows)
+        frame[beat] = np.where(lit[:, :, np.newaxis], colours[:, np.newaxis, :], frame[beat])
+        bank.fade_out(frame, rows)
+
+
+@register_mode
+class BassStrobe(Mode):
+    __slots__ = ()
+    name = "Bass Strobe"
+    soft_edges = False
+
+    def render(self, frame, features, dt):
+        bank, rows = self.bank, self.rows
+        now = features.timestamp
+        bank.advance_step(rows)
+        triggered = features.beats(bank.bass_band[rows], bank.bass_threshold[rows])
+        strobe = bank.debounced(rows, triggered, bank.bass_debounce_time, bank.bass_debounce, now)
+
+        # Apply the strobe effect (turn on all LEDs) and reset fading
+        strobe_rows = rows[strobe]
+        bank.bass_debounce_time[strobe_rows] = features.trigger_times(bank.bass_band[strobe_rows])
+        frame[strobe] = bank.colours(strobe_rows)[:, np.newaxis, :]
+        bank.fade_out_count[strobe_rows] = 0
+
+        # If not strobing, apply fading effect
+        bank.fade_out(frame, rows, soft_edges=self.soft_edges, mask=~strobe)
+
+
+@register_mode
+class BassStrobe1(BassStrobe):
+    __slots__ = ()
+    name = "Bass Strobe 1"
+    soft_edges = True
+
+
+@register_mode
+class BassMidStrobe(Mode):
+    __slots__ = ()
+    name = "Bass & Mid Strobe"
+    per_bar_random = True   #The mid strobe lands at a random point on each bar
+
+    def render(self, frame, features, dt):
+        bank, rows = self.bank, self.rows
+        now = features.timestamp
+        bank.advance_step(rows)
+        bass_triggered = features.beats(bank.bass_band[rows], bank.bass_threshold[rows])
+        mid_triggered = features.beats(bank.mid_band[rows], bank.mid_threshold[rows])
+        bass_strobe = bank.debounced(rows, bass_triggered, bank.bass_debounce_time, bank.bass_debounce, now)
+        mid_strobe = ~bass_strobe & bank.debounced(rows, mid_triggered, bank.debounce_time, bank.mid_debounce, now)
+
+        # Bass strobe, turn on all LEDs at half brightness
+        bass_rows = rows[bass_strobe]
+        bank.bass_debounce_time[bass_rows] = features.trigger_times(bank.bass_band[bass_rows])
+        frame[bass_strobe] = (bank.colours(bass_rows) // 2)[:, np.newaxis, :]
+
+        # Mid strobe, a soft edged flash of the colour halfway along the cycle at a random point along the bar
+        mid_rows = rows[mid_strobe]
+        bank.debounce_time[mid_rows] = features.trigger_times(bank.mid_band[mid_rows])
+        colours = bank.colours(mid_rows, bank.palette_length[mid_rows] // 2)
+        #The strobe can be no longer than the bar, bars can be shorter than length_mid_strobe when num_leds is set for a device
+        length = np.minimum(bank.length_mid_strobe[mid_rows], bank.led_count[mid_rows])
+        start = np.random.randint(0, bank.led_count[mid_rows] - length + 1)
+        offset = bank.led_index - start[:, np.newaxis]
+        in_strobe = (offset >= 0) & (offset < length[:, np.newaxis])
+        sine_factor = np.sin(np.pi * offset / np.maximum(length - 1, 1)[:, np.newaxis])
+        strobe_pixels = sine_factor[:, :, np.newaxis] * colours[:, np.newaxis, :]
+        frame[mid_strobe] = np.where(in_strobe[:, :, np.newaxis], strobe_pixels, frame[mid_strobe])
+
+        # Reset fading when strobe is active, otherwise fade out
+        strobe = bass_strobe | mid_strobe
+        bank.fade_out_count[rows[strobe]] = 0
+        bank.fade_out(frame, rows, soft_edges=True, mask=~strobe)
+
+
+@register_mode
+class SineWave(WaveMode):
+    __slots__ = ()
+    name = "Sine Wave"
+    uses_frame = False
+
+    def __init__(self, bank):
+        super().__init__(bank)
+        # sin(pi * (SINE_FREQUENCY * position + time)) squared to bias towards dimmer pixels
+        self.wave = WaveSynth(bank.led_positions, [(SINE_FREQUENCY / 2, 0.5)], power=2)
+
+    def render(self, frame, features, dt):
+        bank, rows = self.bank, self.rows
+        beat = features.beats(bank.bass_band[rows], bank.bass_threshold[rows])
+
+        # Increment time to animate the wave, speeding up on the beat
+        last_time_change = bank.last_time_change[rows]
+        time_change = np.where(beat, np.minimum(last_time_change * 3, 0.09), np.maximum(0.003, last_time_change * 0.97))
+        self.wave.advance(rows, time_change)
+        bank.last_time_change[rows] = time_change
+
+        bank.advance_step(rows)
+        frame[:] = self.wave.render(rows, bank.colours(rows))
+
+
+@register_mode
+class Swirl(WaveMode):
+    __slots__ = ()
+    name = "Swirl"
+    uses_frame = False
+
+    def __init__(self, bank):
+        super().__init__(bank)
+        # Three travelling sine waves, biased towards dimmer pixels
+        self.wave = WaveSynth(bank.led_positions, [(7, 1.2), (13, -0.7), (17, 0.5)], power=4)
+
+    def render(self, frame, features, dt):
+        bank, rows = self.bank, self.rows
+        beat = features.beats(bank.bass_band[rows], bank.bass_threshold[rows])
+
+        # Increment time to animate the wave, speeding up and jumping colour on the beat
+        last_time_change = bank.last_time_change[rows]
+        time_change = np.where(beat, np.minimum(last_time_change * 2, 0.03), np.maximum(0.003, last_time_change * 0.95))
+        bank.current_step[rows[beat]] = (bank.current_step[rows[beat]] + 50) % bank.palette_length[rows[beat]]
+        self.wave.advance(rows, time_change)
+        bank.last_time_change[rows] = time_change
+
+        frame[:] = self.wave.render(rows, bank.colours(rows))
+
 
 class mode:
     def __init__(self, name = None, audio_reactive = False, mode_func = None, auto_cycle = False):  
         self.name = name
         self.audio_reactive = audio_reactive
         self.auto_cycle = auto_cycle
-        self.mode_func = mode_func
+        self.mode_func = mode_func     #The registered Mode class which renders this mode
 
 class ModeManager:
     def __init__(self, controller_idx):
         self.mode_config_file = 'moths_lighting/moths_lighting/config/mode_config.yaml'
         self.modes = []
         self.modes_menu = []
+        self.mode_index = {}        #Mode name -> index in self.modes
         self.auto_cycle_modes = []
         self.controller_idx = controller_idx
         self.set_mode_config()
         self.generate_auto_cycle_modes()
         
     def add_mode(self,mode):
+        self.mode_index[mode.name] = len(self.modes)
         self.modes.append(mode)
         self.modes_menu.append(mode.name)
         
@@ -85,6 +317,10 @@ class ModeManager:
             name = config["name"]
             audio_reactive = config["audio_reactive"]
             auto_cycle = config["auto_cycle"]
-            new_mode = mode(name = name, audio_reactive = audio_reactive, auto_cycle = auto_cycle)
+            new_mode = mode(name = name, audio_reactive = audio_reactive, mode_func = MODES.get(name), auto_cycle = auto_cycle)
             self.add_mode(new_mode)
+        #Add any registered modes which aren't in the config yet
+        for name, mode_class in MODES.items():
+            if mode_class.in_menu and name not in self.modes_menu:
+                self.add_mode(mode(name = name, audio_reactive = mode_class.audio_reactive, mode_func = mode_class))
         #print(f'Modes added: {[mode.name for mode in self.modes]}')
\ No newline at end of file
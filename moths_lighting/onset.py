@@ -0,0 +1,49 @@
+import numpy as np
+
+#Finds onsets (the start of a kick, snare, etc.) in the band vector as it streams in, at a fixed cost per hop.
+#The spectral flux of each band is how much it rose since the last hop (falls are ignored). A band has an onset when its flux is more
+#than sensitivity standard deviations over its mean flux of the last history hops, so the threshold follows the level of the music.
+#The flux history of each band is kept in a ring buffer with running sums, so the mean and deviation do not need the whole history each hop.
+#After an onset a band is quiet for min_interval seconds so one hit is not counted twice.
+class OnsetDetector:
+    def __init__(self, num_bands, history=43, sensitivity=2.0, floor=0.05, min_interval=0.1):
+        self.num_bands = num_bands
+        self.history = history          #Hops of flux the threshold is taken over, 43 hops of 512 samples is half a second
+        self.sensitivity = sensitivity
+        self.floor = floor              #Added to the threshold so the noise in quiet passages is not taken as onsets
+        self.min_interval = min_interval
+        self.previous = np.zeros(num_bands, dtype=np.float32)
+        self.flux = np.zeros(num_bands, dtype=np.float32)
+        self.flux_history = np.zeros((history, num_bands), dtype=np.float32)
+        self.flux_sum = np.zeros(num_bands)
+        self.flux_sum_sq = np.zeros(num_bands)
+        self.index = 0
+        self.count = 0
+        self.last_onset = np.full(num_bands, -np.inf)
+        self.onsets = 0
+
+    def process(self, bands, timestamp):
+        # Add a hop's band vector, returns a bool array with True for each band with an onset in this hop
+        flux = self.flux
+        np.subtract(bands, self.previous, out=flux)
+        np.maximum(flux, 0, out=flux)
+        self.previous[:] = bands
+
+        #Compare with the threshold of the hops before this one, there are no onsets until half the history is filled
+        if self.count >= self.history // 2:
+            mean = self.flux_sum / self.count
+            deviation = np.sqrt(np.maximum(self.flux_sum_sq / self.count - mean * mean, 0))
+            onsets = (flux > mean + self.sensitivity * deviation + self.floor) & (timestamp - self.last_onset >= self.min_interval)
+            self.last_onset[onsets] = timestamp
+            self.onsets += int(np.count_nonzero(onsets))
+        else:
+            onsets = np.zeros(self.num_bands, dtype=bool)
+
+        #Replace the oldest hop in the history
+        oldest = self.flux_history[self.index]
+        self.flux_sum += flux - oldest
+        self.flux_sum_sq += flux * flux - oldest * oldest
+        oldest[:] = flux
+        self.index = (self.index + 1) % self.history
+        self.count = min(self.count + 1, self.history)
+        return onsets
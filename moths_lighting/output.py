@@ -0,0 +1,67 @@
+import numpy as np
+
+
+#The final stage of rendering, applies each bar's brightness and gamma to its frame through a lookup table.
+#The modes render at full brightness and the table is only rebuilt when the brightness or gamma change.
+class OutputLUT:
+    def __init__(self, num_bars, num_leds):
+        #A 256 entry table per channel of each bar, flattened so the whole frame is looked up with one np.take
+        self.table = np.zeros((num_bars, 3, 256), dtype=np.uint8)
+        self.offsets = np.arange(num_bars * 3).reshape(num_bars, 1, 3) * 256
+        self.index = np.zeros((num_bars, num_leds, 3), dtype=np.intp)
+
+    def build(self, brightness, gamma):
+        levels = np.arange(256) / 255
+        curve = 255 * levels[np.newaxis, :] ** gamma[:, np.newaxis] * np.clip(brightness, 0, 1)[:, np.newaxis]
+        self.table[:] = np.round(curve)[:, np.newaxis, :]
+
+    def apply(self, frames, out):
+        np.add(frames, self.offsets, out=self.index)
+        np.take(self.table.reshape(-1), self.index, out=out, mode='clip')
+
+
+#The last stage before sending, converts a device's bars from the bank's RGB output to the format its strips take.
+#Applies a 3x3 colour correction matrix, extracts a white channel for RGBW strips and reorders the channels,
+#each as one pass over all of the device's pixels, writing straight into the device's packet buffer.
+class DeviceOutput:
+    def __init__(self, source, buffer, num_leds, pixel_order='RGB', colour_matrix=None):
+        # source is the device's rows of the bank output (num_bars, bank num_leds, 3), buffer its packet buffer
+        num_bars = source.shape[0]
+        self.source = source[:, :num_leds]      #Bars shorter than the bank are padded, only their own LEDs are sent
+        self.order = ['RGBW'.index(channel) for channel in pixel_order]
+        self.rgbw = 'W' in pixel_order
+        self.packet = np.frombuffer(buffer, dtype=np.uint8).reshape(num_bars, num_leds, len(pixel_order))
+        self.pixels = np.zeros((num_bars, num_leds, 4), dtype=np.uint8)        #R, G, B, W
+
+        #Colour correction is skipped for the identity matrix
+        self.matrix = None
+        if colour_matrix is not None and not np.allclose(colour_matrix, np.eye(3)):
+            self.matrix = np.asarray(colour_matrix, dtype=np.float32).T
+            self.corrected = np.zeros((num_bars, num_leds, 3), dtype=np.float32)
+            self.linear = np.zeros((num_bars, num_leds, 3), dtype=np.float32)
+
+    def apply(self):
+        rgb = self.pixels[:, :, :3]
+        if self.matrix is not None:
+            np.copyto(self.linear, self.source)
+            np.matmul(self.linear, self.matrix, out=self.corrected)
+            np.clip(self.corrected, 0, 255, out=self.corrected)
+            np.rint(self.corrected, out=self.corrected)
+            np.copyto(rgb, self.corrected, casting='unsafe')
+        else:
+            np.copyto(rgb, self.source)
+
+        #The white channel takes the part of the colour common to red, green and blue
+        if self.rgbw:
+            white = self.pixels[:, :, 3]
+            np.minimum(rgb[:, :, 0], rgb[:, :, 1], out=white)
+            np.minimum(white, rgb[:, :, 2], out=white)
+            rgb -= white[:, :, np.newaxis]
+
+        for packet_channel, channel in enumerate(self.order):
+            self.packet[:, :, packet_channel] = self.pixels[:, :, channel]
+
+
+def valid_pixel_order(pixel_order):
+    # A pixel order is some ordering of RGB, or of RGBW
+    return sorted(pixel_order) in (sorted('RGB'), sorted('RGBW'))
@@ -0,0 +1,60 @@
+import numpy as np
+
+#A single producer, single consumer ring buffer of audio samples, preallocated so nothing is allocated per chunk.
+#The audio callback is the only writer and only moves write_index, the audio thread is the only reader and only moves read_index,
+#so neither side needs a lock. The indices count every sample ever written or read, the buffer position is the index modulo the capacity.
+#When the reader falls so far behind that the buffer is full the new samples are dropped and counted as an overrun,
+#the samples already in the buffer are never overwritten while the reader might be copying them.
+class RingBuffer:
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.write_index = 0
+        self.read_index = 0
+        self.overruns = 0           #Writes which did not fit in the buffer
+        self.dropped_samples = 0    #Samples lost to overruns
+        self.skipped_samples = 0    #Samples the reader skipped to catch up
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def write(self, samples):
+        # Called from the audio callback only
+        count = len(samples)
+        free = self.capacity - (self.write_index - self.read_index)
+        if count > free:
+            self.overruns += 1
+            self.dropped_samples += count - free
+            count = free
+        start = self.write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:count - first] = samples[first:count]
+        #Publish the samples only once they have been copied
+        self.write_index += count
+
+    def read(self, out, max_backlog=None):
+        # Copy the next len(out) samples into out, returns False if there are not that many yet. Called from the reader only.
+        # If more than max_backlog samples are waiting the oldest are skipped, so the analysis stays close to real time.
+        count = len(out)
+        available = self.write_index - self.read_index
+        if available < count:
+            return False
+        if max_backlog is not None and available > max_backlog:
+            skip = (available - max_backlog) // count * count
+            self.skipped_samples += skip
+            self.read_index += skip
+        start = self.read_index % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:count - first]
+        self.read_index += count
+        return True
+
+    def stats(self):
+        return {
+            'overruns': self.overruns,
+            'dropped_samples': self.dropped_samples,
+            'skipped_samples': self.skipped_samples,
+            'backlog': self.available(),
+        }
@@ -0,0 +1,76 @@
+import time
+
+#Paces the render loop on absolute deadlines from the monotonic clock, so sleep and computation errors do not add up as drift
+#and wall clock changes do not affect it. The loop ticks at the fastest device's fps and each device is only due on the ticks
+#closest to its own deadlines, so every device runs at its own fps from the one loop.
+#A frame that wakes up late is caught up by keeping the next deadline on the grid, if it is later than a whole frame
+#the missed frames are dropped (and counted) rather than rendered in a burst.
+class FrameScheduler:
+    def __init__(self, device_fps):
+        self.device_periods = [1 / fps for fps in device_fps]
+        self.period = min(self.device_periods, default=1 / 40)
+        self.next_deadline = None
+        self.device_deadlines = [None] * len(self.device_periods)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.late_frames = 0        #Frames which started more than half a frame after their deadline
+        self.dropped_frames = 0     #Frames skipped because the loop fell more than a whole frame behind
+        self.lateness_sum = 0.0
+        self.lateness_sum_sq = 0.0
+        self.max_lateness = 0.0
+        self.stats_start = time.monotonic()
+
+    def wait(self):
+        # Sleep until the next frame's deadline, then return the indices of the devices due on this frame
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        if now < self.next_deadline:
+            time.sleep(self.next_deadline - now)
+            now = time.monotonic()
+
+        lateness = now - self.next_deadline
+        if lateness >= self.period:
+            missed = int(lateness // self.period)
+            self.dropped_frames += missed
+            self.next_deadline += missed * self.period
+            lateness -= missed * self.period
+        if lateness > self.period / 2:
+            self.late_frames += 1
+        self.frames += 1
+        self.lateness_sum += lateness
+        self.lateness_sum_sq += lateness * lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+
+        frame_deadline = self.next_deadline
+        self.next_deadline += self.period
+
+        #A device is due on the tick nearest its deadline, then its next deadline is one of its own frames later
+        due = []
+        for idx, deadline in enumerate(self.device_deadlines):
+            if deadline is None or deadline <= frame_deadline + self.period / 2:
+                deadline = frame_deadline if deadline is None else deadline
+                deadline += self.device_periods[idx]
+                #Start again from this frame if the device has fallen behind, rather than catching up in a burst
+                self.device_deadlines[idx] = deadline if deadline > frame_deadline else frame_deadline + self.device_periods[idx]
+                due.append(idx)
+        return due
+
+    def stats(self):
+        # The frame rate, jitter and late frame stats since the last call
+        elapsed = time.monotonic() - self.stats_start
+        frames = max(self.frames, 1)
+        mean = self.lateness_sum / frames
+        jitter = max(self.lateness_sum_sq / frames - mean * mean, 0.0) ** 0.5
+        stats = {
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'jitter_ms': jitter * 1000,
+            'mean_lateness_ms': mean * 1000,
+            'max_lateness_ms': self.max_lateness * 1000,
+            'late_frames': self.late_frames,
+            'dropped_frames': self.dropped_frames,
+        }
+        self.reset_stats()
+        return stats
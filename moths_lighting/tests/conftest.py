@@ -0,0 +1,34 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#The modules import each other by name, as when main.py is run from the package directory
+sys.path.insert(0, PACKAGE_DIR)
+
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path, monkeypatch):
+    # The configs are read from moths_lighting/moths_lighting/config relative to the working directory, run each test
+    # in a copy of them so nothing the test saves touches the repo's configs
+    shutil.copytree(os.path.join(PACKAGE_DIR, 'config'), tmp_path / 'moths_lighting' / 'moths_lighting' / 'config')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_controller():
+    # Builds ArtnetControllers for the given esp configs and stops their send workers after the test
+    from artnet import ArtnetController
+    controllers = []
+
+    def make(esp_configs):
+        controller = ArtnetController(esp_configs)
+        controllers.append(controller)
+        return controller
+
+    yield make
+    for controller in controllers:
+        controller.stop_devices()
@@ -0,0 +1,32 @@
+import numpy as np
+
+from artnet_input import ArtnetInput
+from artnet_manager import ArtnetManager
+from backends import make_artdmx_header
+
+
+def make_device(target_ip, universe, num_leds=200):
+    # 200 RGB LEDs take two universes
+    return ArtnetManager(target_ip, num_leds * 3, universe=universe)
+
+
+def send(artnet_input, universe, level):
+    packet = bytearray(make_artdmx_header(universe, 512)) + bytes([level]) * 512
+    artnet_input.receive(packet, len(packet))
+
+
+def test_a_universe_is_only_merged_into_one_device():
+    artnet_input = ArtnetInput()
+    first, second, third = make_device('10.0.0.1', 0), make_device('10.0.0.2', 1), make_device('10.0.0.3', 2)
+    for device in (first, second, third):
+        artnet_input.add_device(device, 'ltp')
+    assert [universe for universe, _, _, _ in artnet_input.devices[first]] == [0, 1]
+    #Universe 1 is already merged into the first device, the second only takes universe 2
+    assert [universe for universe, _, _, _ in artnet_input.devices[second]] == [2]
+    assert [universe for universe, _, _, _ in artnet_input.devices[third]] == [3]
+
+    send(artnet_input, 1, 200)
+    for device in (first, second):
+        artnet_input.merge(device)
+    assert np.all(np.frombuffer(first.packet, dtype=np.uint8)[510:] == 200)
+    assert not np.any(np.frombuffer(second.packet, dtype=np.uint8))
@@ -0,0 +1,51 @@
+import queue
+
+import numpy as np
+
+from audio_features import AudioFrame, FeatureExtractor, ONSET_STYLE, TRIGGER_STYLES
+from fft_plan import FFTPlan
+
+MAX_STYLE = TRIGGER_STYLES.index('max')
+
+
+def make_frame(plan, timestamp, onset_bands=()):
+    # Quiet bins and bands, with onsets in the given bands of the band vector
+    fft_data = np.full(plan.num_outputs, 0.01, dtype=np.float32)
+    onsets = np.zeros(plan.num_bands, dtype=bool)
+    onsets[list(onset_bands)] = True
+    return AudioFrame(fft_data, plan.bands(fft_data), plan.band_freqs, timestamp, onsets)
+
+
+def test_onset_style_beats_on_the_onset_flag_alone():
+    plan = FFTPlan(44100, 512, 512, 5000)
+    extractor = FeatureExtractor()
+    onset_band, max_band = extractor.set_bands([(30, 250, ONSET_STYLE, 0), (30, 250, MAX_STYLE, 0)])
+    thresholds = np.array([0.9, 0.9])
+
+    features = extractor.extract(make_frame(plan, 1.0, onset_bands=[1]))
+    #The magnitudes are far under the threshold, only the onset style band beats
+    assert list(features.beats([onset_band, max_band], thresholds)) == [True, False]
+    assert list(features.level_beats(np.array([ONSET_STYLE, MAX_STYLE]), thresholds)) == [True, False]
+    assert list(features.trigger_times([onset_band, max_band])) == [1.0, features.timestamp]
+
+    features = extractor.extract(make_frame(plan, 2.0))
+    assert not features.beats([onset_band, max_band], thresholds).any()
+    assert not features.level_beats(np.array([ONSET_STYLE, MAX_STYLE]), thresholds).any()
+
+
+def test_strobe_debounce_is_timed_from_the_onset(make_controller):
+    plan = FFTPlan(44100, 512, 512, 5000)
+    controller = make_controller([{'target_ip': '127.0.0.1', 'fps': 60, 'num_bars': 2, 'edit_config': 1, 'keepalive': 0}])
+    bars = controller.bar_bank.bars
+    strobe = [mode.name for mode in bars[0].mode_manager.modes].index("Bass Strobe")
+    for bar in bars:
+        bar.state = strobe
+        bar.trigger_style = 'onset'
+        bar.bass_threshold = 1
+        bar.bass_debounce = 0
+    led_queue = queue.Queue()
+    #The onset was captured a while before the bars render
+    led_queue.put(make_frame(plan, 5.0, onset_bands=[1]))
+    controller.update_bars(led_queue)
+    assert np.all(controller.bar_bank.bass_debounce_time[:2] == 5.0)
+    assert controller.bar_bank.frames[:2].any()
@@ -0,0 +1,99 @@
+import queue
+
+import numpy as np
+import yaml
+
+from audio_features import AudioFrame
+from fft_plan import FFTPlan
+
+
+def device_config(target_ip, fps):
+    return {'target_ip': target_ip, 'fps': fps, 'num_bars': 2, 'edit_config': 1, 'keepalive': 0}
+
+
+def make_frames(plan, count, seed):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        fft_data = rng.random(plan.num_outputs).astype(np.float32)
+        onsets = rng.random(plan.num_bands) > 0.9
+        frames.append(AudioFrame(fft_data, plan.bands(fft_data), plan.band_freqs, float(i), onsets))
+    return frames
+
+
+def record_features(controller):
+    # Wrap the bank's render to keep the features each device's rows were rendered with
+    rendered = []
+    render = controller.bar_bank.render
+
+    def record(features, rows=None):
+        rendered.append((set(np.asarray(rows).tolist()), features))
+        return render(features, rows)
+
+    controller.bar_bank.render = record
+    return rendered
+
+
+def assert_same_features(features, expected):
+    assert np.array_equal(features.magnitudes, expected.magnitudes)
+    assert np.array_equal(features.levels, expected.levels)
+    assert features.energy == expected.energy
+    assert np.array_equal(features.onsets, expected.onsets)
+    assert features.onset_time == expected.onset_time
+
+
+def test_full_rate_device_gets_the_tick_average(make_controller):
+    # A device rendered every tick must see the same features as when the whole queue was averaged for every device
+    plan = FFTPlan(44100, 512, 512, 5000)
+    controller = make_controller([device_config('127.0.0.1', 60), device_config('127.0.0.2', 30)])
+    fast, slow = controller.artnet_devices
+    rendered = record_features(controller)
+    led_queue = queue.Queue()
+    frames = make_frames(plan, 40, seed=1)
+    for tick in range(10):
+        tick_frames = frames[tick * 4:tick * 4 + 4]
+        for frame in tick_frames:
+            led_queue.put(frame)
+        due = [fast, slow] if tick % 2 else [fast]
+        rendered.clear()
+        controller.update_bars(led_queue, due)
+        expected = controller.feature_extractor.extract(AudioFrame.average(tick_frames))
+        fast_features = [features for rows, features in rendered if rows & set(controller.device_rows[fast].tolist())]
+        assert len(fast_features) == 1
+        assert_same_features(fast_features[0], expected)
+        if tick % 2:
+            #The slow device skipped the last tick, it takes the max of the two ticks' averages
+            previous = AudioFrame.average(frames[tick * 4 - 4:tick * 4])
+            expected = controller.feature_extractor.extract(AudioFrame.peak([previous, AudioFrame.average(tick_frames)]))
+            slow_features = [features for rows, features in rendered if rows & set(controller.device_rows[slow].tolist())]
+            assert len(slow_features) == 1
+            assert_same_features(slow_features[0], expected)
+
+
+def test_use_bands_reads_the_band_vector(make_controller, run_dir):
+    # use_bands is set from the display through set_parameter, saved in the bar config and reaches the feature extractor
+    plan = FFTPlan(44100, 512, 512, 5000)
+    controller = make_controller([device_config('127.0.0.1', 60)])
+    rows = controller.device_rows[controller.artnet_devices[0]]
+    bank = controller.bar_bank
+    rendered = record_features(controller)
+    #Silent bins, but a loud band vector
+    bands = np.ones(plan.num_bands, dtype=np.float32)
+    frame = AudioFrame(np.zeros(plan.num_outputs, dtype=np.float32), bands, plan.band_freqs, 0.0, np.zeros(plan.num_bands, dtype=bool))
+
+    led_queue = queue.Queue()
+    led_queue.put(frame)
+    controller.update_bars(led_queue)
+    features = rendered[-1][1]
+    assert not features.beats(bank.bass_band[rows], bank.bass_threshold[rows]).any()
+
+    controller.set_parameter('use_bands', 1)
+    assert controller.get_parameter('use_bands') == 1
+    with open(run_dir / 'moths_lighting' / 'moths_lighting' / 'config' / 'bar_config.yaml') as file:
+        assert yaml.safe_load(file)[0]['use_bands'] == 1
+    led_queue.put(frame)
+    controller.update_bars(led_queue)
+    features = rendered[-1][1]
+    assert np.all(features.magnitudes[bank.bass_band[rows]] == 1)
+    assert np.all(features.magnitudes[bank.mid_band[rows]] == 1)
+    assert features.beats(bank.bass_band[rows], bank.bass_threshold[rows]).all()
@@ -0,0 +1,42 @@
+import numpy as np
+
+TABLE_SIZE = 4096          #Entries in one cycle of the sine table, a power of 2 so indices wrap with a mask
+AMPLITUDE = 1024           #Fixed point amplitude of the sine table
+
+
+#Synthesises a sum of travelling sine waves along every bar of a BarBank.
+#Each wave is evaluated from a precomputed sine table, the phase of each wave is kept in an accumulator per bar,
+#and the normalising and power law shaping of the sum is folded into a lookup table.
+class WaveSynth:
+    def __init__(self, led_positions, waves, power):
+        # waves is a list of (cycles along the bar, cycles per unit of time) for each sine wave in the sum
+        self.mask = TABLE_SIZE - 1
+        self.table = np.round(AMPLITUDE * np.sin(2 * np.pi * np.arange(TABLE_SIZE) / TABLE_SIZE)).astype(np.int32)
+        self.speeds = np.array([speed for _, speed in waves]) * TABLE_SIZE
+
+        # The phase of every LED relative to the start of the bar, in table entries, for each wave
+        self.offsets = np.stack([np.round(led_positions * cycles * TABLE_SIZE).astype(np.int64) & self.mask for cycles, _ in waves])
+        self.phase = np.zeros((led_positions.shape[0], len(waves)))
+
+        # Map the sum of the waves (-len(waves) to +len(waves)) to a 0-255 level, biased towards dimmer pixels
+        span = len(waves) * AMPLITUDE
+        levels = (np.arange(-span, span + 1) + span) / (2 * span)
+        self.shape = np.round(255 * levels ** power).astype(np.uint16)
+        self.span = span
+
+    def advance(self, rows, time_change):
+        # Move each bar's waves along by its time change
+        self.phase[rows] = (self.phase[rows] + time_change[:, np.newaxis] * self.speeds) % TABLE_SIZE
+
+    def levels(self, rows):
+        # The 0-255 level of each LED of the bars
+        phase = self.phase[rows].astype(np.int64)
+        total = np.full((len(rows), self.offsets.shape[2]), self.span, dtype=np.int64)
+        for wave, offsets in enumerate(self.offsets):
+            total += self.table[(offsets[rows] + phase[:, wave, np.newaxis]) & self.mask]
+        return self.shape[total]
+
+    def render(self, rows, colours):
+        # The frames of the bars, each LED is its bar's colour scaled by its level
+        levels = self.levels(rows)
+        return levels[:, :, np.newaxis] * colours.astype(np.uint16)[:, np.newaxis, :] // 255